@@ -0,0 +1,236 @@
+"""
+Бенчмарк парсеров на сохраненных страницах, без запросов к сайтам.
+
+Для каждой страницы из fixtures/ замеряются разбор списка релизов (parse_site_urls),
+разбор релиза (parsing_release_*) и формирование ответа (render.prepare_response):
+страниц в секунду, p50/p99 времени одного вызова и пиковая память (tracemalloc).
+Результаты сравниваются с baseline.json, при ухудшении больше порога скрипт завершается с кодом 1.
+Перед замером релизы разбираются каждым доступным бэкендом (parser_backend.compare_backends),
+при расхождении с разбором всей страницы html.parser скрипт также завершается с кодом 1.
+
+Запуск из корня проекта:
+
+ ``python benchmarks/bench_parsers.py``: замер и сравнение с baseline.json
+
+ ``python benchmarks/bench_parsers.py --backend selectolax``: замер с другим бэкендом разбора html
+
+ ``python benchmarks/bench_parsers.py --save-baseline``: замер и запись baseline.json
+
+ ``python benchmarks/bench_parsers.py --record``: обновить fixtures/ страницами с сайтов
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from typing import Callable, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import parser_backend  # noqa: E402
+from main import KinoReleaseBot, Release  # noqa: E402
+from release_info import ReleaseInfo  # noqa: E402
+from render import prepare_response  # noqa: E402
+from settings import sites, KEY_MEGA_FILM, KEY_LORD_FILM, KEY_NEWSTUDIO  # noqa: E402
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+
+# differences below these are noise and are not regressions
+NOISE_FLOOR = {'p50_ms': 0.05, 'peak_kb': 16}
+
+# listing page of site and release url, which the saved release page belongs to
+FIXTURES = {
+    'megashara': {
+        'listing': 'http://megashara.com/movies',
+        'release': 'http://megashara.com/movies/130470/',
+    },
+    'lordsfilm': {
+        'listing': 'http://lordsfilms.tv/films',
+        'release': 'http://lordsfilms.tv/films/29470-ford-protiv-ferrari-2019.html',
+    },
+    'newstudio': {
+        'listing': 'http://newstudio.tv/viewforum.php?f=444&sort=2',
+        'release': 'http://newstudio.tv/viewtopic.php?t=27470',
+    },
+}
+
+
+def get_fixture_path(site: str, kind: str) -> str:
+    return os.path.join(FIXTURES_DIR, f'{site}_{kind}.html')
+
+
+def read_fixture(site: str, kind: str) -> bytes:
+    with open(get_fixture_path(site, kind), 'rb') as file:
+        return file.read()
+
+
+def parse_release(url: str, html: bytes, is_less_info: bool) -> ReleaseInfo:
+    """Разбирает релиз (разбор не обращается к сайтам)"""
+
+    info = Release.parsing(url, html, is_less_info)
+    if info is None:
+        raise ValueError(f'Fixture is not parsed: {url}')
+    return info
+
+
+def get_cases() -> List[tuple]:
+    """Возвращает замеряемые вызовы: (название, функция без аргументов)"""
+
+    cases = []
+    for site, urls in FIXTURES.items():
+        listing_html = read_fixture(site, 'listing')
+        release_html = read_fixture(site, 'release')
+        url = urls['release']
+
+        cases.append((f'{site}.listing',
+                      lambda u=urls['listing'], h=listing_html: KinoReleaseBot.parse_site_urls(u, h)))
+
+        for is_less_info, mode in [(True, 'less'), (False, 'full')]:
+            if site == 'newstudio' and not is_less_info:
+                continue  # newstudio has only one reply
+
+            info = parse_release(url, release_html, is_less_info)
+            cases.append((f'{site}.parsing_{mode}',
+                          lambda u=url, h=release_html, l=is_less_info: parse_release(u, h, l)))
+            cases.append((f'{site}.prepare_{mode}',
+                          lambda i=info, l=is_less_info: prepare_response(i, True, l)))
+
+    return cases
+
+
+def check_backends() -> bool:
+    """Сверяет разбор сохраненных релизов всеми доступными бэкендами, возвращает True, если расхождений нет"""
+
+    pages = [(urls['release'], get_fixture_path(site, 'release')) for site, urls in FIXTURES.items()]
+    return parser_backend.compare_backends(pages)
+
+
+def measure(func: Callable, iterations: int, warmup: int) -> dict:
+    """Замеряет вызов func: страниц в секунду, p50/p99 в мс и пиковую память в КБ"""
+
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # memory is measured separately, tracemalloc slows down the calls
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'pages_per_sec': round(len(timings) / sum(timings), 1),
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Возвращает описания ухудшений results относительно baseline больше чем на threshold"""
+
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+
+        for metric, floor in NOISE_FLOOR.items():
+            if result[metric] > base[metric] * (1 + threshold) and result[metric] - base[metric] > floor:
+                regressions.append(f'{name} {metric}: {base[metric]} -> {result[metric]}')
+
+    return regressions
+
+
+def record():
+    """Сохраняет в fixtures/ страницы списков релизов и последний релиз каждого списка"""
+
+    import requests
+
+    listings = {
+        'megashara': sites[KEY_MEGA_FILM],
+        'lordsfilm': sites[KEY_LORD_FILM],
+        'newstudio': sites[KEY_NEWSTUDIO][0],
+    }
+    for site, listing_url in listings.items():
+        listing_html = requests.get(listing_url, timeout=30).content
+        release_url = KinoReleaseBot.parse_site_urls(listing_url, listing_html)[-1]
+        release_html = requests.get(release_url, timeout=30).content
+
+        for kind, html in [('listing', listing_html), ('release', release_html)]:
+            with open(get_fixture_path(site, kind), 'wb') as file:
+                file.write(html)
+
+        print(f'{site}: {listing_url} {release_url}')
+        print(f'  update FIXTURES[{site!r}] with these urls')
+
+
+def main():
+    parser = ArgumentParser(description='Offline benchmark of release parsers')
+    parser.add_argument('--backend', choices=parser_backend.BACKENDS, default=parser_backend.backend,
+                        help='Html parser backend, default is settings.html_parser')
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown relative to baseline, 0.25 = 25%%')
+    parser.add_argument('--save-baseline', action='store_true', help='Write results to baseline.json')
+    parser.add_argument('--record', action='store_true', help='Download fresh fixtures from the sites')
+    args = parser.parse_args()
+
+    if args.record:
+        return record()
+
+    if not check_backends():
+        print('Html parser backends give different releases')
+        sys.exit(1)
+
+    parser_backend.set_backend(args.backend)
+    backend = parser_backend.backend
+
+    results = {}
+    print(f'backend: {backend}')
+    print(f'{"case":<28}{"pages/sec":>12}{"p50 ms":>10}{"p99 ms":>10}{"peak KB":>10}')
+    for name, func in get_cases():
+        result = results[name] = measure(func, args.iterations, args.warmup)
+        print(f'{name:<28}{result["pages_per_sec"]:>12}{result["p50_ms"]:>10}'
+              f'{result["p99_ms"]:>10}{result["peak_kb"]:>10}')
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    if args.save_baseline:
+        baseline[backend] = results
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as file:
+            json.dump(baseline, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f'Baseline saved: {BASELINE_FILE}')
+        return
+
+    if backend not in baseline:
+        print(f'No baseline for {backend}, run with --save-baseline')
+        return
+
+    regressions = compare(results, baseline[backend], args.threshold)
+    if regressions:
+        print(f'Regressions over {args.threshold:.0%}:')
+        print('\n'.join(f'  {regression}' for regression in regressions))
+        sys.exit(1)
+
+    print('No regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+"""
+Нагрузочный тест цикла обновления на локальной замене сайтов и Telegram Bot API.
+
+Локальный http-сервер работает как прокси бота (settings.proxy) и отвечает за megashara, lordsfilm,
+newstudio, rating.kinopoisk.ru и api.telegram.org. У каждого хоста настраиваются задержка и доля ошибок,
+на страницах списков каждый цикл появляется заданное число новых релизов.
+
+Замеряются длительность цикла обновления (update_cycle), время рассылки оповещений N чатам,
+число запросов за цикл по хостам, время построения ответа /last all и ответа из готового дайджеста.
+
+Запуск из корня проекта:
+
+ ``python benchmarks/loadtest.py --subscriptions 200 --chats 2000 --cycles 3``
+
+Если config.py нет, используется тестовый (токен и подписки не нужны - все запросы идут на замену).
+"""
+
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from argparse import ArgumentParser
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    config = sys.modules['config'] = types.ModuleType('config')
+    config.TOKEN = '123456:LOADTEST'
+    config.OWNER_ID = 1
+    config.newstudio_subscr = []
+
+RATING_URL = 'http://rating.kinopoisk.ru/{film_id}.xml'  # the stand-in does not serve https
+TELEGRAM_URL = 'http://api.telegram.org/bot{0}/{1}'
+
+HOSTS = ['megashara.com', 'lordsfilms.tv', 'newstudio.tv', 'rating.kinopoisk.ru', 'api.telegram.org']
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 512
+
+
+class StandIn:
+    """
+    Замена сайтов и Telegram: http-прокси, который сам отвечает на все запросы.
+    Номер цикла задает содержимое страниц списков: каждый цикл в начале списков появляются новые релизы.
+    """
+
+    def __init__(self, latency: dict, error_rate: dict, releases: int, new_per_cycle: int):
+        """
+        **Args**:
+
+         ``latency``: задержка ответа по хосту, в секундах
+
+         ``error_rate``: доля ответов 500 (для api.telegram.org - 429) по хосту
+
+         ``releases``: число релизов на странице списка
+
+         ``new_per_cycle``: число новых релизов на странице списка за цикл
+        """
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.releases = releases
+        self.new_per_cycle = new_per_cycle
+        self.cycle = 0
+
+        self.requests = Counter()  # host -> число запросов
+        self.sent = Counter()  # chat_id -> число сообщений
+        self._lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def do_POST(self):
+                stand_in.handle(self)
+
+        self.server = ThreadingServer(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def start(self):
+        threading.Thread(name='Stand-in', target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def get_last_id(self) -> int:
+        return 100000 + self.cycle * self.new_per_cycle
+
+    def handle(self, request: BaseHTTPRequestHandler):
+        url = urlsplit(request.path)
+        host = url.hostname or request.headers.get('Host', '')
+        with self._lock:
+            self.requests[host] += 1
+
+        time.sleep(self.latency.get(host, 0))
+
+        body = b''
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            body = request.rfile.read(length)
+
+        if random.random() < self.error_rate.get(host, 0):
+            if host == 'api.telegram.org':
+                return self.send(request, 429, {'ok': False, 'error_code': 429,
+                                                'description': 'Too Many Requests: retry after 1',
+                                                'parameters': {'retry_after': 1}})
+            return self.send(request, 500, 'Internal Server Error')
+
+        if host == 'api.telegram.org':
+            return self.send(request, 200, self.telegram(url.query, body))
+        if host == 'rating.kinopoisk.ru':
+            return self.send(request, 200, '<rating><kp_rating>7.5</kp_rating><imdb_rating>7.1</imdb_rating></rating>')
+
+        self.send(request, 200, self.page(host, url))
+
+    @staticmethod
+    def send(request: BaseHTTPRequestHandler, status: int, content):
+        if isinstance(content, dict):
+            content, content_type = json.dumps(content), 'application/json'
+        else:
+            content_type = 'text/html; charset=utf-8'
+
+        content = content.encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def telegram(self, query: str, body: bytes) -> dict:
+        # telebot passes the method params in the query string
+        params = {**parse_qs(query), **parse_qs(body.decode('utf-8'))}
+        data = {key: values[0] for key, values in params.items()}
+        chat_id = int(data.get('chat_id', 0))
+        with self._lock:
+            self.sent[chat_id] += 1
+            message_id = self.sent[chat_id]
+
+        return {'ok': True, 'result': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': data.get('text', ''),
+        }}
+
+    def page(self, host: str, url) -> str:
+        last_id = self.get_last_id()
+        ids = range(last_id, last_id - self.releases, -1)
+        path = url.path
+
+        if host == 'megashara.com':
+            section = path.strip('/').split('/')[0] or 'movies'
+            release_id = re.search(r'/(\d+)/?$', path)
+            if release_id:
+                return self.megashara_release(section, int(release_id.group(1)))
+            links = ''.join(f'<div class="name-block"><a href="http://megashara.com/{section}/{i}/">{i}</a></div>'
+                            for i in ids)
+            return f'<html><body><div id="mid-side">{links}</div></body></html>'
+
+        if host == 'lordsfilms.tv':
+            release_id = re.search(r'/(\d+)-[^/]*\.html$', path)
+            if release_id:
+                return self.lordsfilm_release(int(release_id.group(1)))
+            links = ''.join(f'<div class="short"><a href="http://lordsfilms.tv/films/{i}-film-{i}.html">{i}</a></div>'
+                            for i in ids)
+            return f'<html><body><div id="dle-content">{links}</div></body></html>'
+
+        query = parse_qs(url.query)
+        if path.endswith('viewtopic.php'):
+            return self.newstudio_release(int(query['t'][0]))
+
+        # every forum (subscription) has its own topic ids
+        forum = int(query.get('f', ['0'])[0])
+        links = ''.join(f'<div class="topic-list"><a href="./viewtopic.php?t={forum * 1000000 + i}">{i}</a></div>'
+                        for i in ids)
+        return f'<html><body>{links}</body></html>'
+
+    @staticmethod
+    def megashara_release(section: str, i: int) -> str:
+        return f'''<html><body><div id="mid-side"><h1>Релиз {i} (2019)</h1>
+<div class="preview"><img src="http://megashara.com/img/{i}.jpg"></div>
+<table class="info-table"><tr><td><b>Жанр:</b><span>Драма</span></td></tr>
+<tr><td><b>Студия/Страна:</b><span>США</span></td></tr>
+<tr><td><b>Перевод:</b><span>Дублированный</span></td></tr></table>
+<a href="https://www.kinopoisk.ru/film/{i}/"><img alt="Кинопоиск" src="kp.png"></a>
+<div class="back-bg3">Описание {section} {i}<table class="info-table">
+<tr><td><b>Видео:</b><span>1080p</span></td></tr><tr><td><b>Звук:</b><span>AC3</span></td></tr>
+<tr><td><b>Размер:</b><span>2 GB</span></td></tr></table></div></div></body></html>'''
+
+    @staticmethod
+    def lordsfilm_release(i: int) -> str:
+        return f'''<html><body><div class="fmain"><div class="fcols"><div><h1>Фильм {i} смотреть онлайн</h1></div>
+<div class="fposter"><img src="/uploads/{i}.jpg"></div>
+<ul><li><span>Жанр:</span> <a>Фильмы, Драма</a></li><li><span>Страна:</span>США</li>
+<li><span>Перевод:</span>Дубляж</li><li><span>Качество:</span> <a>HD</a></li></ul>
+<div class="db-rates"><div class="r-kp">7.1</div><div class="r-imdb">6.9</div></div>
+<div class="fdesc">Описание {i}</div></div></div></body></html>'''
+
+    @staticmethod
+    def newstudio_release(i: int) -> str:
+        return f'''<html><body><div class="accordion-inner">
+<span class="post-b">Сериал {i} (Сезон 1, Серия 1) / Series {i} (2019) WEB-DL 1080p</span>
+<a title="Линк на это сообщение">Сегодня 12:00</a></div>
+<a class="seedmed" href="download.php?id={i}">torrent</a></body></html>'''
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def main():
+    parser = ArgumentParser(description='Load test of the update cycle against local stand-ins')
+    parser.add_argument('--subscriptions', type=int, default=20, help='Newstudio forums in subscription')
+    parser.add_argument('--chats', type=int, default=100, help='Subscribed chats')
+    parser.add_argument('--cycles', type=int, default=3, help='Measured update cycles')
+    parser.add_argument('--releases', type=int, default=30, help='Releases on a listing page')
+    parser.add_argument('--new-per-cycle', type=int, default=1, help='New releases per listing page per cycle')
+    parser.add_argument('--latency', type=float, default=0.05, help='Response delay of the sites, seconds')
+    parser.add_argument('--telegram-latency', type=float, default=0.02, help='Response delay of Bot API, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of 500 responses of the sites')
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help='Share of 429 responses of Bot API')
+    parser.add_argument('--telegram-rate', type=float, default=None,
+                        help='Override settings.broadcast_rate_global, messages/sec')
+    parser.add_argument('--no-last', action='store_true', help='Do not measure /last all')
+    args = parser.parse_args()
+
+    sites_latency = {host: args.latency for host in HOSTS}
+    sites_latency['api.telegram.org'] = args.telegram_latency
+    error_rate = {host: args.error_rate for host in HOSTS}
+    error_rate['api.telegram.org'] = args.telegram_error_rate
+
+    stand_in = StandIn(sites_latency, error_rate, releases=args.releases, new_per_cycle=args.new_per_cycle)
+    stand_in.start()
+
+    # data/ and logs/ of the bot go to a temporary directory
+    os.chdir(tempfile.mkdtemp(prefix='kino_loadtest_'))
+
+    import settings
+    import main as bot_main
+    from telebot import apihelper, types as telebot_types
+    from scheduler import PollScheduler
+
+    settings.sites[settings.KEY_NEWSTUDIO] = [f'http://newstudio.tv/viewforum.php?f={i}&sort=2'
+                                              for i in range(1, args.subscriptions + 1)]
+    bot_main.proxy = stand_in.url
+    apihelper.proxy = {'http': stand_in.url}
+    apihelper.API_URL = TELEGRAM_URL
+    bot_main.Release.rating_service.url = RATING_URL
+    # kinopoiskpy does not go through the proxy, trailers are not searched (full info is prefetched after alerts)
+    bot_main.Release.trailer_service.search = lambda title, directors: None
+    if args.telegram_rate:
+        bot_main.broadcast_rate_global = args.telegram_rate
+
+    bot = bot_main.KinoReleaseBot(debug=False, logs_show=False)
+    # every listing page is due in every cycle
+    bot.poll_scheduler = PollScheduler(interval=0, interval_min=0, interval_max=0, speedup=1, slowdown=1,
+                                       backoff_max=0, jitter=0)
+    for chat_id in range(1, args.chats + 1):
+        bot.storage.add_chat(chat_id, f'user{chat_id}')
+
+    print(f'listing pages: {len(bot.get_listing())}, chats: {args.chats}, stand-in: {stand_in.url}')
+
+    # the first cycle only fills the storage, like the start with --skip_first_alert
+    start = time.perf_counter()
+    bot.update_cycle(is_alert=False)
+    print(f'warm-up cycle: {time.perf_counter() - start:.2f}s')
+
+    cycles = []
+    for cycle in range(1, args.cycles + 1):
+        stand_in.cycle = cycle
+        requests_before = stand_in.requests.copy()
+        sent_before = sum(stand_in.sent.values())
+
+        start = time.perf_counter()
+        new_urls = bot.update_cycle(is_alert=True)
+        duration = time.perf_counter() - start
+
+        while not bot.broadcaster.is_idle():
+            time.sleep(0.05)
+        fan_out = time.perf_counter() - start - duration
+
+        requests = stand_in.requests - requests_before
+        sent = sum(stand_in.sent.values()) - sent_before
+        cycles.append((duration, fan_out))
+        print(f'cycle {cycle}: new {len(new_urls)}, update {duration:.2f}s, fan-out {fan_out:.2f}s '
+              f'({sent} messages), requests: {dict(requests)}')
+
+    durations = [duration for duration, _ in cycles]
+    fan_outs = [fan_out for _, fan_out in cycles]
+    print(f'update cycle: mean {statistics.mean(durations):.2f}s, p99 {percentile(durations, 0.99):.2f}s')
+    print(f'fan-out: mean {statistics.mean(fan_outs):.2f}s, p99 {percentile(fan_outs, 0.99):.2f}s')
+
+    if not args.no_last:
+        message = telebot_types.Message.de_json({
+            'message_id': 1,
+            'date': int(time.time()),
+            'chat': {'id': 1, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'Load'},
+            'text': '/last all',
+        })
+        keys = bot.get_last_keys('all')
+        for attempt in ['cold', 'cached']:
+            if attempt == 'cold':
+                bot.release_cache = bot_main.ReleaseCache(os.path.join(bot.data_dir, 'release_cache_cold.json'),
+                                                          ttl=bot_main.release_cache_ttl,
+                                                          max_size=bot_main.release_cache_size)
+            start = time.perf_counter()
+            bot.get_last_reply(keys)
+            print(f'/last all build ({attempt}): {time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        bot.refresh_last_digest()
+        print(f'/last digest refresh: {time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        bot.command_last(message)
+        print(f'/last all (digest): {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    bot.runtime.close()
+    stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+from metrics import metrics
+
+
+class RateLimiter:
+    """Ограничение частоты операций (token bucket), потокобезопасное"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        **Args**:
+
+         ``rate``: допустимое число операций в секунду
+
+         ``burst``: максимальное число операций подряд без ожидания, по умолчанию - rate
+        """
+
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Ожидает, пока операция станет допустимой"""
+
+        while True:
+            with self._lock:
+                wait = self._wait_time()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Запрещает операции на seconds секунд"""
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class Broadcaster:
+    """
+    Рассылка сообщений по чатам в фоне.
+    Отправки в разные чаты выполняются параллельно в пуле потоков, в один чат - по очереди.
+    Соблюдаются общий лимит и лимит на чат, при ответе 429 выдерживается retry_after.
+    """
+
+    def __init__(self, send: Callable, edit: Callable, workers: int, rate_global: float, rate_chat: float,
+                 max_attempts: int, history_size: int):
+        """
+        **Args**:
+
+         ``send``: функция отправки сообщения send(chat_id, text, parse_mode=...), возвращает Message
+
+         ``edit``: функция изменения сообщения edit(text, chat_id, message_id, parse_mode=...)
+
+         ``workers``: число потоков отправки
+
+         ``rate_global``: сообщений в секунду во все чаты
+
+         ``rate_chat``: сообщений в секунду в один чат
+
+         ``max_attempts``: число попыток отправки одного сообщения
+
+         ``history_size``: число хранимых результатов доставки
+        """
+
+        self.logger = logging.getLogger('main')
+        self.send = send
+        self.edit = edit
+        self.max_attempts = max_attempts
+        self.chat_interval = 1 / rate_chat
+
+        self.limiter = RateLimiter(rate_global)
+        self.deliveries = deque(maxlen=history_size)
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Broadcast')
+        self._lock = threading.Lock()
+        self._lanes = {}  # chat_id -> deque[(text, parse_mode, tag, message_id для изменения)]
+        self._last_sent = {}  # chat_id -> время последней отправки
+
+    @staticmethod
+    def get_retry_after(error: Exception) -> Optional[int]:
+        """Возвращает retry_after из ответа telegram с кодом 429"""
+
+        result = getattr(error, 'result', None)
+        if result is None or getattr(result, 'status_code', None) != 429:
+            return None
+
+        try:
+            return int(result.json().get('parameters', {}).get('retry_after', 1))
+        except ValueError:
+            return 1
+
+    def broadcast(self, chats: Iterable[int], text: str, parse_mode: str = 'HTML', tag: str = None):
+        """
+        Ставит сообщение в очередь отправки во все чаты и сразу возвращает управление
+
+        **Args**:
+
+         ``chats``: id чатов
+
+         ``text``: текст сообщения
+
+         ``tag``: метка рассылки (например, url релиза) для результатов доставки
+        """
+
+        for chat_id in chats:
+            self._enqueue(chat_id, (text, parse_mode, tag, None))
+
+    def edit_delivered(self, tag: str, text: str, parse_mode: str = 'HTML'):
+        """
+        Ставит в очередь изменение текста всех доставленных сообщений рассылки
+
+        **Args**:
+
+         ``tag``: метка рассылки
+
+         ``text``: новый текст сообщения
+        """
+
+        for delivery in list(self.deliveries):
+            if delivery['tag'] == tag and delivery['action'] == 'send' and delivery['ok']:
+                self._enqueue(delivery['chat_id'], (text, parse_mode, tag, delivery['message_id']))
+
+    def _enqueue(self, chat_id: int, item: tuple):
+        with self._lock:
+            lane = self._lanes.get(chat_id)
+            is_idle = lane is None
+            if is_idle:
+                lane = self._lanes[chat_id] = deque()
+            lane.append(item)
+
+        if is_idle:
+            self._executor.submit(self._drain, chat_id)
+
+    def is_idle(self) -> bool:
+        """Все ли сообщения отправлены (очереди чатов удаляются после отправки последнего сообщения)"""
+
+        with self._lock:
+            return not self._lanes
+
+    def _drain(self, chat_id: int):
+        """Отправляет по очереди все сообщения чата"""
+
+        while True:
+            with self._lock:
+                lane = self._lanes[chat_id]
+                if not lane:
+                    del self._lanes[chat_id]
+                    return
+                text, parse_mode, tag, message_id = lane.popleft()
+
+            try:
+                self._deliver(chat_id, text, parse_mode, tag, message_id)
+            except Exception as error:
+                self.logger.exception(f'{error} [CHAT]: {chat_id}')
+
+    def _deliver(self, chat_id: int, text: str, parse_mode: str, tag: str, message_id: Optional[int]):
+        delivery = {'chat_id': chat_id, 'tag': tag, 'action': 'edit' if message_id else 'send', 'ok': False,
+                    'message_id': message_id, 'error': None, 'attempts': 0, 'ts': None}
+
+        while delivery['attempts'] < self.max_attempts:
+            delivery['attempts'] += 1
+
+            wait = self._last_sent.get(chat_id, 0) + self.chat_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.limiter.acquire()
+
+            try:
+                with metrics.timer('telegram_edit' if message_id else 'telegram_send', 'telegram'):
+                    if message_id:
+                        self.edit(text, chat_id, message_id, parse_mode=parse_mode)
+                    else:
+                        message = self.send(chat_id, text, parse_mode=parse_mode)
+                        delivery['message_id'] = getattr(message, 'message_id', None)
+                delivery['ok'] = True
+                delivery['error'] = None
+                break
+
+            except Exception as error:
+                delivery['error'] = str(error)
+                retry_after = self.get_retry_after(error)
+                if retry_after is None:
+                    break
+
+                self.logger.info(f'Flood limit, retry after {retry_after} [CHAT]: {chat_id}')
+                self.limiter.pause(retry_after)
+
+            finally:
+                self._last_sent[chat_id] = time.monotonic()
+
+        delivery['ts'] = time.time()
+        self.deliveries.append(delivery)
+
+        if not delivery['ok']:
+            self.logger.info(f'Не могу отправить {chat_id} {delivery["error"]}')
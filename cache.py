@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from release_info import ReleaseInfo
+
+
+class ReleaseCache:
+    """
+    Кэш разобранных релизов: url -> ReleaseInfo.
+    Записи устаревают по TTL, заданному для каждого сайта, при переполнении вытесняются
+    давно не использованные (LRU). Кэш хранится в json файле (запись - список значений полей ReleaseInfo)
+    и переживает перезапуск.
+    """
+
+    def __init__(self, filename: str, ttl: dict, max_size: int, encoding: str = 'utf-8'):
+        """
+        **Args**:
+
+         ``filename``: файл, в котором хранится кэш
+
+         ``ttl``: время жизни записи в секундах по названию сайта в url, ключ 'default' - для остальных
+
+         ``max_size``: максимальное число записей
+        """
+
+        self.logger = logging.getLogger('main')
+        self.filename = filename
+        self.ttl = ttl
+        self.max_size = max_size
+        self.encoding = encoding
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._items = OrderedDict()  # url -> {'ts': время разбора, 'full': полная ли информация, 'info': ReleaseInfo}
+        self._dirty = False
+        self.on_change = []  # callbacks on_change(url), called after set and update
+
+        self.load()
+
+    def get_ttl(self, url: str) -> int:
+        """Возвращает время жизни записи для url"""
+
+        for site, ttl in self.ttl.items():
+            if site in url:
+                return ttl
+        return self.ttl.get('default', 0)
+
+    def _is_fresh(self, url: str, entry: dict) -> bool:
+        return time.time() - entry['ts'] < self.get_ttl(url)
+
+    def get(self, url: str, is_less_info: bool = True) -> Optional[dict]:
+        """
+        Возвращает запись о релизе или None, если записи нет или она устарела.
+        Поле 'info' записи равно None, если релиз был разобран, но не подлежит выводу.
+
+        **Args**:
+
+         ``url``: url релиза
+
+         ``is_less_info``: достаточно ли сокращенной информации о релизе
+        """
+
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None:
+                return None
+
+            if not self._is_fresh(url, entry):
+                del self._items[url]
+                self._dirty = True
+                return None
+
+            if not is_less_info and not entry['full']:
+                return None
+
+            self._items.move_to_end(url)
+            return entry
+
+    def set(self, url: str, info: Optional[ReleaseInfo], is_less_info: bool = True):
+        """
+        Сохраняет разобранный релиз
+
+        **Args**:
+
+         ``url``: url релиза
+
+         ``info``: данные релиза, None - если релиз не подлежит выводу
+
+         ``is_less_info``: разобрана ли только сокращенная информация о релизе
+        """
+
+        with self._lock:
+            self._items[url] = {'ts': time.time(), 'full': not is_less_info, 'info': info}
+            self._items.move_to_end(url)
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+            self._dirty = True
+
+        self._notify(url)
+
+    def update(self, url: str, fields: dict):
+        """Обновляет поля релиза, уже сохраненного в кэше, не продлевая время жизни записи"""
+
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None or entry['info'] is None:
+                return False
+
+            entry['info'] = entry['info'].replace(**fields)
+            self._dirty = True
+
+        self._notify(url)
+        return True
+
+    def _notify(self, url: str):
+        for callback in self.on_change:
+            try:
+                callback(url)
+            except Exception as error:
+                self.logger.exception(f'{error} [URL]: {url}')
+
+    def load(self):
+        """Загружает не устаревшие записи из файла"""
+
+        if not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, 'r', encoding=self.encoding) as file:
+                data = json.load(file)
+        except ValueError as error:
+            self.logger.error(f'{error} [FILE]: {self.filename}')
+            return
+
+        with self._lock:
+            for url, entry in data.items():
+                if not self._is_fresh(url, entry):
+                    continue
+
+                # 'fields' is a list of ReleaseInfo values, or a dict in caches of previous versions
+                fields = entry['fields']
+                try:
+                    info = ReleaseInfo.from_data(fields, url) if fields is not None else None
+                except (ValueError, TypeError) as error:
+                    # written with another layout of ReleaseInfo fields, the release is parsed again
+                    self.logger.error(f'{error!r} [CACHE]: {url}')
+                    continue
+                self._items[url] = {'ts': entry['ts'], 'full': entry['full'], 'info': info}
+
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def save(self):
+        """Записывает кэш в файл, если он изменился"""
+
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps({
+                    url: {'ts': entry['ts'], 'full': entry['full'],
+                          'fields': entry['info'].to_data() if entry['info'] is not None else None}
+                    for url, entry in self._items.items()
+                }, ensure_ascii=False)
+                self._dirty = False
+
+            tmp_filename = f'{self.filename}.tmp'
+            with open(tmp_filename, 'w', encoding=self.encoding) as file:
+                file.write(data)
+            os.replace(tmp_filename, self.filename)
@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Iterable, List, Optional
+
+
+class LastDigest:
+    """
+    Готовые ответы команды /last: для каждого ключа сайта хранится блок с последними релизами.
+    Блок помечается устаревшим, когда на сайте найдены новые релизы, когда обновилась запись кэша
+    одного из его релизов или когда он старше max_age. Устаревшие блоки перестраивает поток обновления,
+    сама команда только склеивает готовые блоки.
+    """
+
+    def __init__(self, keys: Iterable[str], max_age: float):
+        """
+        **Args**:
+
+         ``keys``: ключи сайтов из settings.sites
+
+         ``max_age``: время, после которого блок перестраивается, даже если не помечен устаревшим, в секундах
+        """
+
+        self.keys = list(keys)
+        self.max_age = max_age
+
+        self._lock = threading.Lock()
+        self._parts = {}  # key -> {'text': блок ответа, 'urls': set url релизов блока, 'ts': время построения}
+        self._dirty = set(self.keys)
+        self._building = set()  # keys returned by get_outdated, until set_part or failed
+
+    def mark_dirty(self, key: str):
+        """Помечает блок сайта устаревшим"""
+
+        with self._lock:
+            self._dirty.add(key)
+
+    def on_release_changed(self, url: str):
+        """
+        Помечает устаревшими блоки, в которые входит релиз url (вызывается при изменении кэша).
+        Перестраиваемые блоки не помечаются: их релизы сохраняет в кэш сама перестройка
+        """
+
+        with self._lock:
+            for key, part in self._parts.items():
+                if url in part['urls'] and key not in self._building:
+                    self._dirty.add(key)
+
+    def get_outdated(self) -> List[str]:
+        """
+        Возвращает ключи блоков, которые нужно перестроить, и снимает с них пометку.
+        Для каждого ключа затем вызывается set_part или, если перестроить блок не удалось, failed
+        """
+
+        now = time.time()
+        with self._lock:
+            outdated = [key for key in self.keys
+                        if key in self._dirty or key not in self._parts or now - self._parts[key]['ts'] >= self.max_age]
+            self._dirty.difference_update(outdated)
+            self._building.update(outdated)
+        return outdated
+
+    def set_part(self, key: str, text: str, urls: List[str]):
+        """Сохраняет построенный блок сайта"""
+
+        with self._lock:
+            self._parts[key] = {'text': text, 'urls': set(urls), 'ts': time.time()}
+            self._building.discard(key)
+
+    def failed(self, key: str):
+        """Возвращает пометку блоку, который не удалось перестроить: он перестроится при следующем обновлении"""
+
+        with self._lock:
+            self._building.discard(key)
+            self._dirty.add(key)
+
+    def get(self, keys: List[str]) -> Optional[str]:
+        """
+        Возвращает ответ /last для сайтов keys или None, если блоки еще не построены
+
+        **Args**:
+
+         ``keys``: ключи сайтов в порядке settings.sites
+        """
+
+        with self._lock:
+            if any(key not in self._parts for key in keys):
+                return None
+            reply = ''.join(self._parts[key]['text'] for key in keys)
+
+        return reply or 'Релизов не найдено'
@@ -0,0 +1,107 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+
+class CommandDispatcher:
+    """
+    Выполнение команд бота в пулах потоков, чтобы долгая команда одного пользователя не задерживала остальных.
+    Быстрые и медленные команды выполняются в разных пулах, у медленных - ограничение числа одновременных на чат.
+    Одинаковые медленные запросы, пришедшие одновременно, выполняются один раз (collapse).
+    """
+
+    def __init__(self, fast_workers: int, slow_workers: int, chat_limit: int):
+        """
+        **Args**:
+
+         ``fast_workers``: число потоков для быстрых команд
+
+         ``slow_workers``: число потоков для медленных команд
+
+         ``chat_limit``: максимальное число одновременных медленных команд одного чата
+        """
+
+        self.logger = logging.getLogger('main')
+        self.chat_limit = chat_limit
+
+        self._fast = ThreadPoolExecutor(max_workers=fast_workers, thread_name_prefix='Command-fast')
+        self._slow = ThreadPoolExecutor(max_workers=slow_workers, thread_name_prefix='Command-slow')
+
+        self._lock = threading.Lock()
+        self._chat_slow = {}  # chat_id -> число выполняемых медленных команд
+        self._in_flight = {}  # key -> Future общего результата
+
+    def _run(self, handler: Callable, *args):
+        try:
+            handler(*args)
+        except Exception as error:
+            self.logger.exception(f'{error} [HANDLER]: {getattr(handler, "__name__", handler)}')
+
+    def submit_fast(self, handler: Callable, *args):
+        """Ставит быструю команду в очередь"""
+
+        self._fast.submit(self._run, handler, *args)
+
+    def submit_slow(self, chat_id: int, handler: Callable, *args) -> bool:
+        """
+        Ставит медленную команду в очередь, возвращает False,
+        если у чата уже выполняется chat_limit медленных команд
+
+        **Args**:
+
+         ``chat_id``: id чата, от которого пришла команда
+
+         ``handler``: обработчик команды, вызывается как handler(*args)
+        """
+
+        with self._lock:
+            running = self._chat_slow.get(chat_id, 0)
+            if running >= self.chat_limit:
+                return False
+            self._chat_slow[chat_id] = running + 1
+
+        self._slow.submit(self._run_slow, chat_id, handler, *args)
+        return True
+
+    def _run_slow(self, chat_id: int, handler: Callable, *args):
+        try:
+            self._run(handler, *args)
+        finally:
+            with self._lock:
+                running = self._chat_slow.pop(chat_id, 1) - 1
+                if running:
+                    self._chat_slow[chat_id] = running
+
+    def collapse(self, key: Hashable, func: Callable, *args):
+        """
+        Выполняет func(*args) и возвращает результат. Если такой же запрос (key) уже выполняется,
+        то ожидает и возвращает его результат, не выполняя func повторно
+
+        **Args**:
+
+         ``key``: ключ запроса, одинаковые запросы имеют одинаковый ключ
+
+         ``func``: функция, результат которой нужен
+        """
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._in_flight[key] = Future()
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except Exception as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
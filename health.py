@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import Timing
+from runtime import AsyncRuntime
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class Check(Timing):
+    """Запрос внутри HealthMonitor.track"""
+
+    def __init__(self):
+        super().__init__()
+        self.status = None
+
+
+class HostHealth:
+    """Состояние и статистика запросов к одному хосту"""
+
+    def __init__(self, base_url: str, latency_window: int):
+        self.base_url = base_url  # url for probes
+        self.state = CLOSED
+        self.failures = 0  # consecutive failures and slow responses
+        self.opened = 0.0
+
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=latency_window)  # seconds, successful requests
+        self.last_status = None
+        self.last_error = None
+        self.last_checked = None
+
+
+class HealthMonitor:
+    """
+    Доступность сайтов: автомат (circuit breaker) и статистика задержек и ошибок по каждому хосту.
+    После failures_threshold ошибок или медленных ответов подряд автомат хоста размыкается (open),
+    запросы к хосту сразу завершаются неудачей. Через open_timeout хост проверяется в фоне (half-open):
+    успешная проверка замыкает автомат (closed), неудачная - размыкает снова.
+    """
+
+    def __init__(self, runtime: AsyncRuntime, failures_threshold: int, slow_threshold: float,
+                 open_timeout: float, probe_timeout: float, latency_window: int, proxy=None):
+        """
+        **Args**:
+
+         ``runtime``: фоновый цикл событий с общей aiohttp-сессией, в нем выполняются проверки
+
+         ``failures_threshold``: число ошибок или медленных ответов подряд, после которого автомат размыкается
+
+         ``slow_threshold``: ответ дольше этого времени считается медленным, в секундах
+
+         ``open_timeout``: время до проверки хоста с разомкнутым автоматом, в секундах
+
+         ``probe_timeout``: таймаут проверки, в секундах
+
+         ``latency_window``: число последних ответов для статистики задержек
+
+         ``proxy``: прокси для проверок
+        """
+
+        self.logger = logging.getLogger('main')
+        self.runtime = runtime
+        self.failures_threshold = failures_threshold
+        self.slow_threshold = slow_threshold
+        self.open_timeout = open_timeout
+        self.probe_timeout = probe_timeout
+        self.latency_window = latency_window
+        self.proxy = proxy
+
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> HostHealth
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        return urlsplit(url).netloc
+
+    def _get(self, url: str) -> HostHealth:
+        """Возвращает состояние хоста url, вызывается под self._lock"""
+
+        host = self.get_host(url)
+        health = self._hosts.get(host)
+        if health is None:
+            parts = urlsplit(url)
+            health = self._hosts[host] = HostHealth(f'{parts.scheme}://{host}', self.latency_window)
+        return health
+
+    def allow(self, url: str) -> bool:
+        """Можно ли выполнить запрос к хосту url (автомат замкнут)"""
+
+        with self._lock:
+            health = self._hosts.get(self.get_host(url))
+            return health is None or health.state == CLOSED
+
+    def record(self, url: str, seconds: float, is_error: bool, status: int = None, error: str = None):
+        """
+        Учитывает результат запроса к хосту url
+
+        **Args**:
+
+         ``seconds``: длительность запроса
+
+         ``is_error``: завершился ли запрос ошибкой
+
+         ``status``: код ответа
+
+         ``error``: описание ошибки
+        """
+
+        is_probe_needed = False
+        with self._lock:
+            health = self._get(url)
+            health.requests += 1
+            health.last_checked = time.time()
+            health.last_status = status
+            health.last_error = error
+
+            if is_error:
+                health.errors += 1
+            else:
+                health.latencies.append(seconds)
+
+            if is_error or seconds >= self.slow_threshold:
+                health.failures += 1
+            else:
+                health.failures = 0
+
+            if health.state == CLOSED and health.failures >= self.failures_threshold:
+                health.state = OPEN
+                health.opened = time.time()
+                is_probe_needed = True
+                self.logger.error(f'[CIRCUIT OPEN] {health.base_url}: {health.failures} failures in a row')
+
+        if is_probe_needed:
+            self.runtime.submit(self._probe_later(url))
+
+    @contextmanager
+    def track(self, url: str):
+        """Учитывает запрос в блоке with, исключение в блоке считается ошибкой"""
+
+        check = Check()
+        start = time.perf_counter()
+        try:
+            yield check
+        except Exception as error:
+            self.record(url, time.perf_counter() - start, True, check.status, repr(error))
+            raise
+        else:
+            self.record(url, time.perf_counter() - start, check.is_error, check.status)
+
+    async def _probe_later(self, url: str):
+        """Проверяет хост через open_timeout, пока проверка не будет успешной"""
+
+        while True:
+            await asyncio.sleep(self.open_timeout)
+            with self._lock:
+                health = self._get(url)
+                health.state = HALF_OPEN
+
+            if await self.probe(url):
+                return
+
+    async def probe(self, url: str) -> bool:
+        """Запрашивает главную страницу хоста url и обновляет его состояние, возвращает успешна ли проверка"""
+
+        with self._lock:
+            base_url = self._get(url).base_url
+
+        start = time.perf_counter()
+        status, error = None, None
+        try:
+            session = await self.runtime.get_session()
+            timeout = aiohttp.ClientTimeout(total=self.probe_timeout)
+            async with session.get(base_url, proxy=self.proxy, timeout=timeout) as response:
+                status = response.status
+                await response.read()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            error = repr(exc)
+
+        seconds = time.perf_counter() - start
+        is_ok = status is not None and status < 500 and seconds < self.slow_threshold
+        self.record(base_url, seconds, status is None or status >= 500, status, error)
+
+        with self._lock:
+            health = self._get(url)
+            if health.state != CLOSED and is_ok:
+                health.state = CLOSED
+                health.failures = 0
+            elif health.state != CLOSED:
+                health.state = OPEN
+                health.opened = time.time()
+
+        self.logger.info(f'[PROBE] {base_url}: {"ok" if is_ok else "failed"}, status {status}, {seconds:.2f}s')
+        return is_ok
+
+    def get_status(self, url: str) -> Optional[dict]:
+        """Возвращает состояние и статистику хоста url или None, если к нему еще не было запросов"""
+
+        with self._lock:
+            health = self._hosts.get(self.get_host(url))
+            if health is None:
+                return None
+
+            latencies = sorted(health.latencies)
+            return {
+                'host': self.get_host(url),
+                'state': health.state,
+                'requests': health.requests,
+                'errors': health.errors,
+                'last_status': health.last_status,
+                'last_error': health.last_error,
+                'last_checked': health.last_checked,
+                'p50': statistics.median(latencies) if latencies else None,
+                'p95': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+            }
+
+    def format_status(self, url: str) -> str:
+        """Возвращает описание состояния хоста url для /ping, если данных нет - запускает проверку"""
+
+        status = self.get_status(url)
+        if status is None:
+            self.runtime.submit(self.probe(url))
+            return f'{self.get_host(url)}: данных еще нет, проверка запущена'
+
+        states = {CLOSED: 'доступен', OPEN: 'недоступен', HALF_OPEN: 'проверяется'}
+        reply = (
+            f"{status['host']}: {states[status['state']]}\n"
+            f"Статус код: {status['last_status'] or '-'}\n"
+        )
+        if status['last_error']:
+            reply += f"Ошибка: {status['last_error']}\n"
+        if status['p50'] is not None:
+            reply += f"Время ответа: p50 {status['p50'] * 1000:.0f} мс, p95 {status['p95'] * 1000:.0f} мс\n"
+        reply += (
+            f"Ошибок: {status['errors']} из {status['requests']}\n"
+            f"Проверен: {time.time() - status['last_checked']:.0f} с назад"
+        )
+        return reply
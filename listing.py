@@ -0,0 +1,103 @@
+import hashlib
+import json
+import logging
+import os
+
+
+class ListingValidators:
+    """
+    Валидаторы страниц со списками релизов (ETag, Last-Modified и хэш содержимого).
+    Позволяют делать условные запросы и не разбирать страницу, если она не изменилась.
+    """
+
+    def __init__(self, filename: str, encoding: str = 'utf-8'):
+        self.logger = logging.getLogger('main')
+        self.filename = filename
+        self.encoding = encoding
+
+        self._validators = {}  # url -> {'etag': .., 'last_modified': .., 'hash': ..}
+        self._dirty = False
+
+        self.load()
+
+    @staticmethod
+    def get_hash(content: bytes) -> str:
+        return hashlib.md5(content).hexdigest()
+
+    def get_headers(self, url: str) -> dict:
+        """Возвращает заголовки условного запроса для url"""
+
+        validator = self._validators.get(url, {})
+        headers = {}
+        if validator.get('etag'):
+            headers['If-None-Match'] = validator['etag']
+        if validator.get('last_modified'):
+            headers['If-Modified-Since'] = validator['last_modified']
+        return headers
+
+    def is_unchanged(self, url: str, status: int, content: bytes) -> bool:
+        """
+        Проверяет, изменилась ли страница с прошлого разбора
+
+        **Args**:
+
+         ``url``: url страницы со списком релизов
+
+         ``status``: статус код ответа
+
+         ``content``: содержимое ответа
+        """
+
+        if status == 304:
+            return url in self._validators
+
+        validator = self._validators.get(url)
+        return status == 200 and validator is not None and validator.get('hash') == self.get_hash(content)
+
+    def update(self, url: str, headers, content: bytes):
+        """
+        Запоминает валидаторы успешно разобранной страницы
+
+        **Args**:
+
+         ``url``: url страницы со списком релизов
+
+         ``headers``: заголовки ответа
+
+         ``content``: содержимое ответа
+        """
+
+        self._validators[url] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'hash': self.get_hash(content),
+        }
+        self._dirty = True
+
+    def forget(self, url: str):
+        """Удаляет валидаторы url: следующий запрос страницы будет безусловным"""
+
+        if self._validators.pop(url, None) is not None:
+            self._dirty = True
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, 'r', encoding=self.encoding) as file:
+                self._validators = json.load(file)
+        except ValueError as error:
+            self.logger.error(f'{error} [FILE]: {self.filename}')
+
+    def save(self):
+        """Записывает валидаторы в файл, если они изменились"""
+
+        if not self._dirty:
+            return
+
+        tmp_filename = f'{self.filename}.tmp'
+        with open(tmp_filename, 'w', encoding=self.encoding) as file:
+            file.write(json.dumps(self._validators, indent=4, ensure_ascii=False))
+        os.replace(tmp_filename, self.filename)
+        self._dirty = False
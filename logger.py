@@ -1,9 +1,51 @@
+import atexit
+import json
 import os
 import logging.handlers
+import queue
+import random
 
 
-def get_logger(name='main', dir_='logs', show_logs=True, encoding='utf-8', is_debug=True):
-    """Настройки логгера"""
+class JsonFormatter(logging.Formatter):
+    """Форматирование записи в одну строку json"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'file': record.filename,
+            'line': record.lineno,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает только долю rate DEBUG-записей (они пишутся на каждый url), остальные уровни - все"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno != logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+def get_logger(name='main', dir_='logs', show_logs=True, encoding='utf-8', is_debug=True,
+               is_json=False, debug_sample_rate=1.0):
+    """
+    Настройки логгера. Записи передаются через очередь в отдельный поток,
+    который пишет их в файлы и консоль, вызывающий поток на запись не ждет
+
+    **Args**:
+
+     ``is_json``: писать записи в файлы в виде json
+
+     ``debug_sample_rate``: доля сохраняемых DEBUG-записей
+    """
 
     if not os.path.exists(dir_):
         os.mkdir(dir_)
@@ -14,9 +56,15 @@ def get_logger(name='main', dir_='logs', show_logs=True, encoding='utf-8', is_de
     else:
         logger.setLevel(logging.INFO)
 
-    formatter = logging.Formatter(
-        '[%(filename)s] [LINE:%(lineno)03d] [%(levelname)s] [%(asctime)s]: %(message)s'
-    )
+    if any(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers):
+        return logger
+
+    if is_json:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '[%(filename)s] [LINE:%(lineno)03d] [%(levelname)s] [%(asctime)s]: %(message)s'
+        )
 
     filename = os.path.join(dir_, 'general.log')
     file_handler = logging.handlers.RotatingFileHandler(filename,
@@ -25,13 +73,16 @@ def get_logger(name='main', dir_='logs', show_logs=True, encoding='utf-8', is_de
                                                         encoding=encoding,)
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers = [file_handler]
 
     filename_error = os.path.join(dir_, 'error.log')
-    error_handler = logging.FileHandler(filename_error, encoding=encoding)
+    error_handler = logging.handlers.RotatingFileHandler(filename_error,
+                                                         maxBytes=10 * 1048576,
+                                                         backupCount=3,
+                                                         encoding=encoding,)
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
+    handlers.append(error_handler)
 
     if show_logs is True:
         console_handler = logging.StreamHandler()
@@ -40,6 +91,15 @@ def get_logger(name='main', dir_='logs', show_logs=True, encoding='utf-8', is_de
             '[%(levelname)s] [%(asctime)s]: %(message)s', datefmt='%Y-%m-%d %H:%M:%S'
         )
         console_handler.setFormatter(cons_formatter)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
     return logger
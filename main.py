@@ -1,34 +1,71 @@
 import asyncio
-import json
 import logging
 import os
 import re
 import threading
 import time
 from argparse import ArgumentParser
+from concurrent.futures import as_completed
 from datetime import datetime
-from typing import List, Union
-from kinopoisk.movie import Movie
+from typing import Callable, Iterator, List, Union, Optional
 
 import aiohttp
 import requests
 import telebot
-from bs4 import BeautifulSoup
-from requests import ReadTimeout
 from telebot import apihelper
 from telebot.types import Message
 
 from config import TOKEN, OWNER_ID
+from broadcast import Broadcaster
+from cache import ReleaseCache
+from digest import LastDigest
+from dispatcher import CommandDispatcher
+from health import HealthMonitor
+from listing import ListingValidators
 from logger import get_logger
+from metrics import metrics, get_site, start_server as start_metrics_server
+from parse_pool import ParsePool
+from parser_backend import make_soup, get_available_backend
+from prefetch import Prefetcher
+from profiler import Profiler
+from release_info import ReleaseInfo, TORRENT_PENDING
+from render import prepare_response
+from rating import KinopoiskRating
+from resolver import TorrentResolver
+from runtime import AsyncRuntime
+from scheduler import PollScheduler
+from storage import create_storage, ReleaseIndex
+from trailer import TrailerService
 from settings import (
     ENCODING_NAME,
     proxy,
     timeout_upd_first,
     timeout_upd,
+    timeout_listing,
+    health_failures_threshold, health_slow_threshold, health_open_timeout, timeout_health_probe,
+    health_latency_window,
+    poll_interval_min, poll_interval_max, poll_speedup, poll_slowdown, poll_backoff_max, poll_jitter,
+    async_crawl,
+    num_connections_per_host,
+    http_connections_limit, http_dns_cache_ttl, timeout_http,
     KEY_MEGA_FILM, KEY_MEGA_SERIAL, KEY_NEWSTUDIO, KEY_LORD_FILM,
     sites,
-    num_last_release_per_site,
-    num_pars_url_lordsfilm, num_pars_url_megashara, num_pars_url_newstudio
+    num_last_release_per_site, last_digest_max_age,
+    storage_backend, storage_journal_compact_every, storage_retention,
+    release_cache_size, release_cache_ttl,
+    kinopoisk_rating_url, rating_cache_ttl, timeout_rating,
+    trailer_cache_ttl, trailer_negative_cache_ttl, timeout_trailer, trailer_workers,
+    prefetch_full_info, prefetch_rate_per_host, prefetch_queue_size,
+    parse_workers,
+    html_parser,
+    torrent_retry_delays, timeout_torrent,
+    command_workers_fast, command_workers_slow, command_chat_limit,
+    metrics_host, metrics_port,
+    profile_sample_every, profile_top_n,
+    log_json, log_debug_sample_rate,
+    broadcast_workers, broadcast_rate_global, broadcast_rate_chat, broadcast_max_attempts, broadcast_history_size,
+    num_pars_url_lordsfilm, num_pars_url_megashara, num_pars_url_newstudio,
+    listing_page_url, listing_max_pages,
 )
 
 try:
@@ -38,33 +75,24 @@ except ModuleNotFoundError:
 
 
 class Release:
-    exclude_genre = ['ТВ-Шоу', 'Мультфильм', 'Документальный', 'Anime', 'Спорт', 'КВН']
-    access_country = ['США', 'Россия', 'Германия', 'Великобритания', 'Испания', 'Франция']
+    """Получение релиза: запрос страницы, разбор в ReleaseInfo, рейтинг, кэш и формирование ответа"""
 
-    def __init__(self, url, is_single_request=True, is_less_info=True):
+    newstudio_containers = ['.accordion-inner', '.seedmed', '.genmed']
+    rating_service = KinopoiskRating(url=kinopoisk_rating_url, ttl=rating_cache_ttl, timeout=timeout_rating)
+    trailer_service = TrailerService(ttl=trailer_cache_ttl, negative_ttl=trailer_negative_cache_ttl,
+                                     deadline=timeout_trailer, workers=trailer_workers)
+    torrent_resolver: TorrentResolver = None  # resolves newstudio torrent-file urls, that are not on the page yet
+    health: HealthMonitor = None  # per-host circuit breakers, set by KinoReleaseBot
+    parse_pool: ParsePool = None  # processes that parse pages, set by KinoReleaseBot
+
+    def __init__(self, url, is_single_request=True, is_less_info=True, cache: ReleaseCache = None):
         self.logger = logging.getLogger('main')
         self.is_single_request = is_single_request
         self.is_less_info = is_less_info
+        self.cache = cache
 
         self.url = url
 
-        self.title = None
-        self.kind = None
-        self.photo = None
-
-        self.genre = None
-        self.country = None
-        self.video = None
-        self.audio = None
-        self.description = None
-        self.translate = None
-
-        self.size = None
-        self.torrent = None
-        self.rating = None
-        self.trailer_url = None
-        self.link_more = None
-
     @staticmethod
     def get_month_str(num: int):
         """Получение сокращенного названия месяца по числу"""
@@ -75,6 +103,22 @@ class Release:
         }
         return month_str.get(num)
 
+    @staticmethod
+    def get_release_id(url: str) -> Optional[str]:
+        """Возвращает id релиза из его url (используется в команде /more)"""
+
+        if 'megashara' in url:
+            return url.split('/')[4]
+
+        elif 'lordsfilm' in url:
+            return url.rsplit('/', 1)[1].split('-')[0]
+
+        elif 'newstudio' in url:
+            found = re.findall(r'[?&]t=(\d+)', url)
+            return found[0] if found else None
+
+        return None
+
     @staticmethod
     def get_next_element_text(pars_block, title_parent_bl: str) -> str:
         """
@@ -92,97 +136,151 @@ class Release:
         return parent_bl.next_element.text if parent_bl else '-'
 
     @staticmethod
-    def get_rating_kinopoisk(pars_block) -> dict:
+    def get_kinopoisk_url(pars_block) -> Optional[str]:
         """
-        Возвращает рейтинг кинопоиска из предоставленного блока
+        Возвращает ссылку на релиз на кинопоиске из предоставленного блока
 
         **Args**:
 
-         ``pars_block``: bs4.element-html блок для поиска рейтинга
+         ``pars_block``: bs4.element-html блок для поиска ссылки
         """
 
         try:
-            kinopoisk_url = pars_block.find(alt='Кинопоиск').previous_element['href']
-            film_id = kinopoisk_url.split('/')[-2]
-            rating_url = f'https://rating.kinopoisk.ru/{film_id}.xml'
+            return pars_block.find(alt='Кинопоиск').previous_element['href']
+        except AttributeError:
+            return None
 
-            response = requests.get(rating_url)
-            soup = BeautifulSoup(response.content, 'html.parser')
-            rating = soup.kp_rating.text
+    def get_cached_info(self):
+        """Возвращает ответ по данным из кэша или None, если релиза нет в кэше или данные устарели"""
 
-        except AttributeError:
-            rating = '-'
-            kinopoisk_url = None
+        if self.cache is None:
+            return None
+
+        entry = self.cache.get(self.url, self.is_less_info)
+        if entry is None:
+            return None
 
-        return {'rating': rating, 'kinopoisk_url': kinopoisk_url}
+        info = entry['info']
+        if info is None:
+            return ''
 
-    def get_trailer_url_kinopoisk(self, title: str, directors: list):
-        """Получает ссылку на релиз на кинопоиске, если на кинопоиске есть трейлер"""
+        try:
+            self.schedule_torrent_resolving(info)
+            return prepare_response(info, self.is_single_request, self.is_less_info)
 
-        movie_list = Movie.objects.search(title)
-        if not movie_list:
+        except Exception as error:
+            self.logger.exception(f"{error} [URL]: {self.url}")
             return None
 
-        movie = movie_list[0]
-        # if directors:
-        #     movie.get_content('main_page')
-        #     if not any([d.name in directors for d in movie.directors]):
-        #         return None
+    def schedule_torrent_resolving(self, info: ReleaseInfo):
+        """Ставит в очередь получение ссылки на торрент-файл, если ее еще нет"""
 
-        movie.get_content('trailers')
-        return f"https://www.kinopoisk.ru/film/{movie.id}" if bool(movie.trailers) else None
+        if info.torrent == TORRENT_PENDING and self.torrent_resolver:
+            self.torrent_resolver.schedule(self.url, proxy=proxy)
 
-    async def async_get_info(self, session) -> str:
-        """Асинхронное получение информации о релизе"""
+    async def async_get_info(self, session) -> Optional[str]:
+        """
+        Асинхронное получение информации о релизе.
+        Возвращает '', если релиз не подлежит выводу, и None, если страницу не удалось получить или разобрать
+        """
+
+        if not self.health.allow(self.url):
+            self.logger.debug(f'[CIRCUIT OPEN] [URL]: {self.url}')
+            return None
 
         self.logger.debug(f'Starting {self.url}')
+        site = get_site(self.url)
 
-        async with session.get(self.url, proxy=proxy) as response:
-            self.logger.debug(f'response.status {response.status} {self.url}')
-            text = await response.text()
+        try:
+            with metrics.timer('release_fetch', site) as timing, self.health.track(self.url) as check:
+                async with session.get(self.url, proxy=proxy) as response:
+                    self.logger.debug(f'response.status {response.status} {self.url}')
+                    check.status = response.status
+                    text = await response.text()
 
-            if response.status != 200:
-                return ''
+                if response.status >= 500:
+                    check.failed()
 
-            return self.parsing_and_prepare(self.url, text)
+                if response.status != 200:
+                    timing.failed()
+                    return None
 
-    def get_info(self) -> str:
-        """Получение информации о релизе"""
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(f"{error!r} [URL]: {self.url}")
+            return None
 
-        self.logger.debug(f'Starting {self.url}')
-        response = requests.get(self.url, proxies=apihelper.proxy)
+        late_trailer = None
+        try:
+            info = await self.parse_pool.parse('release_parse', self.url,
+                                               Release.parsing, self.url, text, self.is_less_info)
 
-        if response.status_code != 200:
-            return ''
+            if info and info.kinopoisk_id:
+                rating = await self.rating_service.async_get_rating(session, info.kinopoisk_id, proxy=proxy)
+                info = info.replace(rating=rating)
+
+            if info and info.trailer_search and not info.trailer_url:
+                title, directors = info.trailer_search
+                trailer_url, late_trailer = await self.trailer_service.async_get(title, directors)
+                info = info.replace(trailer_url=trailer_url)
+
+        except Exception as error:
+            self.logger.exception(f"{error} [URL]: {self.url}")
+            return None
+
+        response = self.prepare(info)
+        if late_trailer is not None:
+            # only after prepare: the late url patches the cached entry, not the one stored after it
+            self.trailer_service.on_late(late_trailer, self.on_trailer_found, info.title)
+        return response
 
-        return self.parsing_and_prepare(self.url, response.content)
+    def on_trailer_found(self, trailer_url: str):
+        """Дополняет кэш ссылкой на трейлер, найденной после deadline, - ее получит следующий /more"""
 
-    def parsing_and_prepare(self, url, html: str):
+        if self.cache is not None:
+            self.cache.update(self.url, {'trailer_url': trailer_url})
+
+    def prepare(self, info: Optional[ReleaseInfo]) -> str:
+        """
+        Сохраняет результат разбора в кэш и подготавливает ответ
+
+        **Args**:
+
+         ``info``: разобранные данные релиза, None - если релиз не подлежит выводу
+        """
 
-        reply = ''
         try:
-            if 'megashara' in url:
-                parsing_completed = self.parsing_release_megashara(url, html)
-                if parsing_completed:
-                    reply = self.prepare_response_film()
+            if self.cache is not None:
+                self.cache.set(self.url, info, self.is_less_info)
 
-            elif 'lordsfilm' in url:
-                parsing_completed = self.parsing_release_lordsfilm(url, html)
-                if parsing_completed:
-                    reply = self.prepare_response_film()
+            if info is None:
+                return ''
 
-            elif 'newstudio' in url:
-                parsing_completed = self.parsing_release_newstudio(url, html)
-                if parsing_completed:
-                    reply = self.prepare_response_newstudio()
+            if info.torrent == TORRENT_PENDING:
+                self.logger.error(f"Not found torrent-file url: {self.url}")
+            self.schedule_torrent_resolving(info)
+            return prepare_response(info, self.is_single_request, self.is_less_info)
 
         except Exception as error:
-            self.logger.exception(f"{error} [URL]: {url}")
-            reply = ''
+            self.logger.exception(f"{error} [URL]: {self.url}")
+            return ''
 
-        return reply
+    @classmethod
+    def parsing(cls, url, html: str, is_less_info: bool = True) -> Optional[ReleaseInfo]:
+        """Парсит url в зависимости от сайта, возвращает None, если релиз не подлежит выводу"""
 
-    def parsing_release_megashara(self, url, html: str) -> bool:
+        if 'megashara' in url:
+            return cls.parsing_release_megashara(url, html, is_less_info)
+
+        elif 'lordsfilm' in url:
+            return cls.parsing_release_lordsfilm(url, html, is_less_info)
+
+        elif 'newstudio' in url:
+            return cls.parsing_release_newstudio(url, html)
+
+        return None
+
+    @classmethod
+    def parsing_release_megashara(cls, url, html: str, is_less_info: bool = True) -> Optional[ReleaseInfo]:
         """
         Парсит url Megashara
 
@@ -191,43 +289,46 @@ class Release:
          ``url``: url, который подлежит парсингу
 
          ``html``: страница с контентом
+
+         ``is_less_info``: нужна ли только сокращенная информация о релизе
         """
 
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = make_soup(html, ['#mid-side'])
         pars_block = soup.select_one('#mid-side')
 
         if pars_block.select_one('.big-error') or not pars_block:
-            return False
+            return None
 
         table_2 = pars_block.select_one('.back-bg3 .info-table').extract()
-        self.title = pars_block.h1.text
-        self.photo = pars_block.select_one('.preview img')['src']
-
-        self.genre = self.get_next_element_text(pars_block, 'Жанр:')
-        self.country = self.get_next_element_text(pars_block, 'Студия/Страна:')
-
-        d_kinopoisk = self.get_rating_kinopoisk(pars_block)
-        self.rating = d_kinopoisk['rating']
-        self.trailer_url = d_kinopoisk['kinopoisk_url']
+        fields = {
+            'title': pars_block.h1.text,
+            'photo': pars_block.select_one('.preview img')['src'],
+            'genre': cls.get_next_element_text(pars_block, 'Жанр:'),
+            'country': cls.get_next_element_text(pars_block, 'Студия/Страна:'),
+            'rating': '-',
+            'trailer_url': cls.get_kinopoisk_url(pars_block),
+        }
+        if fields['trailer_url']:
+            fields['kinopoisk_id'] = fields['trailer_url'].split('/')[-2]
 
-        if not self.is_less_info:
-            self.translate = self.get_next_element_text(pars_block, 'Перевод:')
-            self.video = self.get_next_element_text(table_2, 'Видео:')
-            self.audio = self.get_next_element_text(table_2, 'Звук:')
-            self.size = self.get_next_element_text(table_2, 'Размер:')
+        if not is_less_info:
+            fields['translate'] = cls.get_next_element_text(pars_block, 'Перевод:')
+            fields['video'] = cls.get_next_element_text(table_2, 'Видео:')
+            fields['audio'] = cls.get_next_element_text(table_2, 'Звук:')
+            fields['size'] = cls.get_next_element_text(table_2, 'Размер:')
 
             desc_dirty = pars_block.select_one('.back-bg3').text
             desc_clean = re.sub("\n+", '\n', desc_dirty)
-            self.description = desc_clean.strip()
+            fields['description'] = desc_clean.strip()
 
-        url_split = url.split('/')
-        kind_code = KinoReleaseBot.get_site_code("mega_film") if url_split[3] == 'movies' \
+        kind_code = KinoReleaseBot.get_site_code("mega_film") if url.split('/')[3] == 'movies' \
             else KinoReleaseBot.get_site_code("mega_serial")
-        self.link_more = f'{KinoReleaseBot.get_command_code("more_film")}_{kind_code}_{url_split[4]}'
+        fields['link_more'] = f'{KinoReleaseBot.get_command_code("more_film")}_{kind_code}_{cls.get_release_id(url)}'
 
-        return True
+        return ReleaseInfo(url, **fields)
 
-    def parsing_release_lordsfilm(self, url, html: str) -> bool:
+    @classmethod
+    def parsing_release_lordsfilm(cls, url, html: str, is_less_info: bool = True) -> Optional[ReleaseInfo]:
         """
         Парсит url Lordsfilm
 
@@ -236,54 +337,59 @@ class Release:
          ``url``: url, который подлежит парсингу
 
          ``html``: страница с контентом
+
+         ``is_less_info``: нужна ли только сокращенная информация о релизе
         """
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = make_soup(html, ['.fmain'])
 
         if not soup.select_one('.fmain'):
-            return False
+            return None
 
         url_split = url.rsplit('/', 1)
         pars_block = soup.select_one('.fcols')
-        self.title = pars_block.div.h1.text.strip('смотреть онлайн')
-        self.photo = f"{url_split[0]}{pars_block.select_one('.fposter img')['src']}"
+        fields = {
+            'title': pars_block.div.h1.text.strip('смотреть онлайн'),
+            'photo': f"{url_split[0]}{pars_block.select_one('.fposter img')['src']}",
+        }
 
         genre_bl = pars_block.find(string='Жанр:')
         country_bl = pars_block.find(string='Страна:')
 
-        self.kind, self.genre = genre_bl.next_element.next_element.text.split(',', 1) if genre_bl else ('Фильм', '-')
-        self.kind = self.kind.rstrip('ы')
-        self.country = country_bl.next_element if country_bl else '-'
+        kind, fields['genre'] = genre_bl.next_element.next_element.text.split(',', 1) if genre_bl else ('Фильм', '-')
+        fields['kind'] = kind.rstrip('ы')
+        fields['country'] = str(country_bl.next_element) if country_bl else '-'
 
         b_kinopoisk = pars_block.select_one('.db-rates .r-kp')
         b_imdb = pars_block.select_one('.db-rates .r-imdb')
         rating_kp = b_kinopoisk.text if b_kinopoisk else '-'
         rating_imdb = b_imdb.text if b_imdb else '-'
-        self.rating = f"KP {rating_kp}, IMDB {rating_imdb}"
+        fields['rating'] = f"KP {rating_kp}, IMDB {rating_imdb}"
 
-        if not self.is_less_info:
+        if not is_less_info:
             title_en_bl = pars_block.find(string='Название:')
             director_bl = pars_block.find(string='Режиссер:')
             translate_bl = pars_block.find(string='Перевод:')
             video_bl = pars_block.find(string='Качество:')
 
             title_en = title_en_bl.next_element.next_element.text if title_en_bl else None
-            directors = director_bl.next_element.next_element.text.split(',') if director_bl else None
-            self.video = video_bl.next_element.next_element.text if video_bl else '-'
-            self.translate = translate_bl.next_element if translate_bl else '-'
+            directors = tuple(director_bl.next_element.next_element.text.split(',')) if director_bl else None
+            fields['video'] = video_bl.next_element.next_element.text if video_bl else '-'
+            fields['translate'] = str(translate_bl.next_element) if translate_bl else '-'
 
             desc_dirty = pars_block.select_one('.fdesc').text
             desc_clean = re.sub("\n+", '\n', desc_dirty)
-            self.description = desc_clean.strip()
+            fields['description'] = desc_clean.strip()
 
-            title_for_search = title_en if title_en else self.title
-            self.trailer_url = self.get_trailer_url_kinopoisk(title_for_search, directors)
+            # the trailer is searched after parsing, see TrailerService
+            fields['trailer_search'] = (title_en if title_en else fields['title'], directors)
 
         kind_code = KinoReleaseBot.get_site_code("lord_film")
-        self.link_more = f'{KinoReleaseBot.get_command_code("more_film")}_{kind_code}_{url_split[1].split("-")[0]}'
+        fields['link_more'] = f'{KinoReleaseBot.get_command_code("more_film")}_{kind_code}_{cls.get_release_id(url)}'
 
-        return True
+        return ReleaseInfo(url, **fields)
 
-    def parsing_release_newstudio(self, url, html: str) -> bool:
+    @classmethod
+    def parsing_release_newstudio(cls, url, html: str) -> Optional[ReleaseInfo]:
         """
         Парсит url Newstudio
 
@@ -293,10 +399,10 @@ class Release:
 
          ``html``: страница с контентом
         """
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = make_soup(html, cls.newstudio_containers)
         pars_block = soup.select_one('.accordion-inner')
 
-        self.title = pars_block.select_one('.post-b').text
+        title = pars_block.select_one('.post-b').text
         date_release = pars_block.select_one("a[title='Линк на это сообщение']").text
         spl_date_release = date_release.split('-')
         now = datetime.now()
@@ -307,118 +413,124 @@ class Release:
             date_release_year = int(spl_date_release[2].split(' ')[0])
 
             if now.year == date_release_year or now.month == 1:
-                if self.get_month_str(now.month) == date_release_month or \
-                        self.get_month_str(now.month - 1) == date_release_month:
+                if cls.get_month_str(now.month) == date_release_month or \
+                        cls.get_month_str(now.month - 1) == date_release_month:
                     is_new_release = True
         else:
             is_new_release = True
 
-        if is_new_release:
-            torrent_tag = soup.select_one('.seedmed') or soup.select_one('.genmed')
-
-            if not torrent_tag:
-                for _ in range(5):
-                    self.logger.error(f"Not found torrent-file url: ", url)
-                    time.sleep(1 * 60)
-                    response = requests.get(url, proxies=apihelper.proxy)
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    torrent_tag = soup.select_one('.seedmed')
-                    if torrent_tag:
-                        break
-
-            if torrent_tag:
-                torrent_dirty = torrent_tag.get('href')
-                self.torrent = 'http://newstudio.tv/' + torrent_dirty
-            else:
-                self.torrent = '-'
-
-            return True
-
-        else:
-            return False
-
-    def prepare_response_film(self) -> str:
-        """Подготавливает ответ с информацией о фильме"""
-
-        if self.is_less_info:
-            reply = self.prepare_response_film_less()
-        else:
-            reply = self.prepare_response_film_full()
-
-        return reply
-
-    def prepare_response_film_less(self) -> str:
-        """Подготавливает сокращенное инфо для фильмов"""
+        if not is_new_release:
+            return None
 
-        if self.is_single_request and (any(exc_g in self.genre for exc_g in self.exclude_genre)
-                                       or not any(acc_c in self.country for acc_c in self.access_country)):
-            return ''
+        # logged by Release.prepare: this runs in a parse process
+        torrent = cls.get_torrent_url_newstudio(soup) or TORRENT_PENDING
 
-        kind = f"<b>{self.kind}</b><a href='{self.photo}'>.</a>\n" if self.is_single_request else ""
-        title = f"<a href='{self.url}'>{self.title}</a>" if self.is_single_request else f"{self.title}"
+        return ReleaseInfo(url, title=title, torrent=torrent)
 
-        reply = (
-            f"{kind}"
-            f"{title}\n"
-            f"Рейтинг: {self.rating} ({self.link_more})\n\n"
-        )
-        return reply
-
-    def prepare_response_film_full(self) -> str:
-        """Подготавливает развернутое инфо для фильмов"""
-
-        audio = f"Аудио: {self.audio}\n" if self.audio else ''
-        size = f"Размер: {self.size}\n" if self.size else ''
-        trailer = f"<a href='{self.trailer_url}'>перейти</a>" if self.trailer_url else '-'
-
-        reply = (
-            f"<b>{self.kind}</b><a href='{self.photo}'>.</a>\n"
-            f"<a href='{self.url}'>{self.title}</a>\n"
-            f"Жанр: {self.genre}\n"
-            f"Страна: {self.country}\n"
-            f"Перевод: {self.translate}\n"
-            f"Видео: {self.video}\n"
-            f"{audio}"
-            f"{size}"
-            f"Рейтинг: {self.rating}\n"
-            f"Трейлер: {trailer}\n\n"
-            f"{self.description}\n"
-        )
-        return reply
-
-    def prepare_response_newstudio(self) -> str:
-        """Подготавливает ответ для релиза с newstudio"""
+    @staticmethod
+    def get_torrent_url_newstudio(soup) -> Optional[str]:
+        """Возвращает ссылку на торрент-файл со страницы релиза newstudio"""
 
-        reply = ''
+        torrent_tag = soup.select_one('.seedmed') or soup.select_one('.genmed')
+        return f"http://newstudio.tv/{torrent_tag.get('href')}" if torrent_tag else None
 
-        if "WEBDLRip" in self.title:
-            return reply
+    @classmethod
+    def parse_torrent_url_newstudio(cls, html) -> Optional[str]:
+        """Возвращает ссылку на торрент-файл из страницы релиза newstudio"""
 
-        if self.is_single_request:
-            reply = f"<b> \U0000203C РЕЛИЗ \U0000203C</b>\n"
-
-        reply += (
-            f"{self.title} <a href='{self.torrent}'> Торрент \U0001F4E5</a>\n\n"
-        )
-        return reply
+        return cls.get_torrent_url_newstudio(make_soup(html, cls.newstudio_containers))
 
 
 class KinoReleaseBot:
     bot = telebot.TeleBot(TOKEN)
     apihelper.proxy = proxy
 
-    def __init__(self, debug, logs_show):
-        self.logger = get_logger(is_debug=debug, show_logs=logs_show)
+    def __init__(self, debug, logs_show, profile=False):
+        self.logger = get_logger(is_debug=debug, show_logs=logs_show,
+                                 is_json=log_json, debug_sample_rate=log_debug_sample_rate)
+
+        if get_available_backend(html_parser) != html_parser:
+            self.logger.warning(f'Html parser backend {html_parser} is not installed, html.parser is used')
 
         self.data_dir = 'data'
         self._init_need_dirs(dirs=[self.data_dir])
 
-        self.file_data_url = None
-        self.file_data_chats = None
-        self._init_need_files()
+        # json files of previous versions, data from them is migrated to storage once
+        self.file_data_url = os.path.join(self.data_dir, 'data_url.json')
+        self.file_data_chats = os.path.join(self.data_dir, 'data_chats.json')
 
-        self.data_urls = self.load_json(self.file_data_url)
-        self.data_chats = self.load_json(self.file_data_chats)
+        self.storage = create_storage(storage_backend, self.data_dir,
+                                      journal_compact_every=storage_journal_compact_every,
+                                      encoding=ENCODING_NAME)
+        self.storage.migrate_json(self.file_data_url, self.file_data_chats, encoding=ENCODING_NAME)
+
+        self.release_index = ReleaseIndex()
+        for k_site in sites:
+            self.index_release_urls(k_site, self.storage.get_all_urls(k_site))
+
+        self.runtime = AsyncRuntime(limit=http_connections_limit,
+                                    limit_per_host=num_connections_per_host,
+                                    dns_cache_ttl=http_dns_cache_ttl,
+                                    timeout=timeout_http)
+
+        self.health = HealthMonitor(runtime=self.runtime,
+                                    failures_threshold=health_failures_threshold,
+                                    slow_threshold=health_slow_threshold,
+                                    open_timeout=health_open_timeout,
+                                    probe_timeout=timeout_health_probe,
+                                    latency_window=health_latency_window,
+                                    proxy=proxy)
+        Release.health = self.health
+
+        self.parse_pool = ParsePool(workers=parse_workers)
+        Release.parse_pool = self.parse_pool
+
+        self.profiler = Profiler('logs',
+                                 sample_every=profile_sample_every,
+                                 top_n=profile_top_n,
+                                 runtime=self.runtime) if profile else None
+
+        self.dispatcher = CommandDispatcher(fast_workers=command_workers_fast,
+                                            slow_workers=command_workers_slow,
+                                            chat_limit=command_chat_limit)
+
+        self.broadcaster = Broadcaster(send=self.bot.send_message,
+                                       edit=self.bot.edit_message_text,
+                                       workers=broadcast_workers,
+                                       rate_global=broadcast_rate_global,
+                                       rate_chat=broadcast_rate_chat,
+                                       max_attempts=broadcast_max_attempts,
+                                       history_size=broadcast_history_size)
+        self.listing_validators = ListingValidators(os.path.join(self.data_dir, 'listing_validators.json'),
+                                                    encoding=ENCODING_NAME)
+        self.release_cache = ReleaseCache(os.path.join(self.data_dir, 'release_cache.json'),
+                                          ttl=release_cache_ttl,
+                                          max_size=release_cache_size,
+                                          encoding=ENCODING_NAME)
+
+        self.prefetcher = Prefetcher(fetch=self.prefetch_info_full,
+                                     is_cached=self.is_info_full_cached,
+                                     rate_per_host=prefetch_rate_per_host,
+                                     queue_size=prefetch_queue_size)
+
+        self.last_digest = LastDigest(keys=sites, max_age=last_digest_max_age)
+        self.release_cache.on_change.append(self.last_digest.on_release_changed)
+
+        self.poll_scheduler = PollScheduler(interval=timeout_upd,
+                                            interval_min=poll_interval_min,
+                                            interval_max=poll_interval_max,
+                                            speedup=poll_speedup,
+                                            slowdown=poll_slowdown,
+                                            backoff_max=poll_backoff_max,
+                                            jitter=poll_jitter)
+
+        self.torrent_resolver = TorrentResolver(runtime=self.runtime,
+                                                parse_pool=self.parse_pool,
+                                                parse=Release.parse_torrent_url_newstudio,
+                                                delays=torrent_retry_delays,
+                                                timeout=timeout_torrent)
+        self.torrent_resolver.on_resolved.append(self.on_torrent_resolved)
+        Release.torrent_resolver = self.torrent_resolver
 
     @staticmethod
     def _init_need_dirs(dirs: List):
@@ -426,32 +538,10 @@ class KinoReleaseBot:
 
         [os.mkdir(dir_) for dir_ in dirs if not os.path.exists(dir_)]
 
-    def _init_need_files(self):
-        """Создает файлы c начальными данными"""
-
-        self.file_data_url = os.path.join(self.data_dir, 'data_url.json')
-        self.file_data_chats = os.path.join(self.data_dir, 'data_chats.json')
-
-        init_files_data = [
-            (self.file_data_url, {}),
-            (self.file_data_chats, {}),
-        ]
-        [self.dump_json(file, data) for file, data in init_files_data if not os.path.exists(file)]
-
-    @staticmethod
-    def dump_json(filename, data):
-        """Записывает данные в json файл"""
-
-        with open(filename, "w", encoding=ENCODING_NAME) as file:
-            file.write(json.dumps(data, indent=4, ensure_ascii=False))
-
-    @staticmethod
-    def load_json(filename):
-        """Считывает данные из json файла"""
+    def profiled(self, name: str, func):
+        """Возвращает func с выборочным профилированием, если бот запущен с --profile"""
 
-        with open(filename, 'r', encoding=ENCODING_NAME) as file:
-            data = json.load(file)
-        return data
+        return self.profiler.wrap(name, func) if self.profiler else func
 
     @staticmethod
     def get_command_code(command: str):
@@ -464,6 +554,7 @@ class KinoReleaseBot:
             'ip': '/ip',
             'ping_site': '/ping',
             'more_film': '/more',
+            'stats': '/stats',
         }
         return codes.get(command)
 
@@ -480,6 +571,29 @@ class KinoReleaseBot:
         }
         return codes.get(site)
 
+    @classmethod
+    def get_site_code_by_key(cls, key: str, url: str = ''):
+        """
+        Возвращает код сайта по ключу из settings.sites
+
+        **Args**:
+
+         ``key``: ключ сайта
+
+         ``url``: url релиза, нужен для megashara, где фильмы и сериалы различаются по url
+        """
+
+        if key in [KEY_MEGA_FILM, KEY_MEGA_SERIAL] and url:
+            key = KEY_MEGA_FILM if url.split('/')[3] == 'movies' else KEY_MEGA_SERIAL
+
+        names = {
+            KEY_LORD_FILM: 'lord_film',
+            KEY_MEGA_FILM: 'mega_film',
+            KEY_MEGA_SERIAL: 'mega_serial',
+            KEY_NEWSTUDIO: 'newstudio',
+        }
+        return cls.get_site_code(names.get(key, ''))
+
     @staticmethod
     def get_telegram_name(message: Message):
         """Возвращает username в телеграме или, если нету, тогда имя"""
@@ -499,13 +613,12 @@ class KinoReleaseBot:
         chat_id = message.chat.id
         first_name = message.from_user.first_name
 
-        if str(chat_id) in self.data_chats.keys():
+        if self.storage.has_chat(chat_id):
             reply = f"Привет, {first_name}"
 
         else:
             self.bot.send_message(OWNER_ID, f'Мне написал start {self.get_telegram_name(message)}')
-            self.data_chats[chat_id] = message.chat.username
-            self.dump_json(self.file_data_chats, self.data_chats)
+            self.storage.add_chat(chat_id, message.chat.username)
             reply = f"Добро пожаловать, {first_name}"
 
         self.bot.reply_to(message, reply)
@@ -521,6 +634,8 @@ class KinoReleaseBot:
 
             f'{self.get_command_code("ip")}': 'показать ip и регион бота',
 
+            f'{self.get_command_code("stats")}': 'показать время работы этапов обновления по сайтам',
+
             f'{self.get_command_code("ping_site")} X': 'получить статус сайта, где X - код сайта '
             f'(если X не указано, то выведет для {self.get_site_code("lord_film")})',
 
@@ -547,69 +662,90 @@ class KinoReleaseBot:
 
         self.bot.send_message(message.chat.id, help_text, parse_mode='HTML')
 
-    def command_last(self, message: Message):
-        """Выводит данные о последних релизах с указанных сайтов"""
+    def get_last_keys(self, unique_code: Optional[str]) -> List[str]:
+        """Возвращает ключи сайтов для /last по коду сайта в порядке settings.sites"""
 
-        unique_code = message.text.split()[1] if len(message.text.split()) > 1 else None
-        exclude = [KEY_MEGA_FILM, KEY_MEGA_SERIAL, KEY_NEWSTUDIO, KEY_LORD_FILM]
+        codes = {
+            self.get_site_code("mega_film"): [KEY_MEGA_FILM],
+            self.get_site_code("mega_serial"): [KEY_MEGA_SERIAL],
+            self.get_site_code("newstudio"): [KEY_NEWSTUDIO],
+            self.get_site_code("lord_film"): [KEY_LORD_FILM],
+            self.get_site_code("all"): list(sites),
+        }
+        keys = codes.get(unique_code, [KEY_LORD_FILM])
+        return [key for key in sites if key in keys]
 
-        if unique_code == self.get_site_code("all"):
-            exclude = []
-            reply_wait = 'Придется подождать.. (~1мин.) Подписок много.. Ушёл, за информацией..'
+    def get_last_release_urls(self, key: str) -> List[str]:
+        """Возвращает последние url релизов сайта по всем группам"""
 
-        elif unique_code == self.get_site_code("mega_film"):
-            exclude.remove(KEY_MEGA_FILM)
-            reply_wait = 'Подождите.. Вспоминаю о последних фильмах Megashara..'
+        lst_urls = []
+        for group in self.storage.get_groups(key):
+            lst_urls.extend(self.storage.get_last_urls(key, num_last_release_per_site, group))
+        return lst_urls
 
-        elif unique_code == self.get_site_code("mega_serial"):
-            exclude.remove(KEY_MEGA_SERIAL)
-            reply_wait = 'Подождите.. Посмотрю, что там с сериалами на Megashara..'
+    def get_last_part(self, key: str, lst_urls: List[str], failed: List[str] = None) -> str:
+        """
+        Возвращает блок ответа /last для сайта
 
-        elif unique_code == self.get_site_code("newstudio"):
-            exclude.remove(KEY_NEWSTUDIO)
-            reply_wait = 'Придется подождать.. (~1мин.) Получаю информацию о последних релизах Newstudio..'
+        **Args**:
 
-        elif unique_code == self.get_site_code("lord_film"):
-            exclude.remove(KEY_LORD_FILM)
-            reply_wait = 'Придется подождать.. Получаю информацию о последних релизах Lordsfilm..'
+         ``key``: ключ сайта из settings.sites
 
-        else:
-            exclude.remove(KEY_LORD_FILM)
-            reply_wait = 'Подождите.. Получаю информацию о последних релизах Lordsfilm..'
+         ``lst_urls``: url последних релизов сайта
 
-        self.bot.reply_to(message, reply_wait)
-        data = self.data_urls
+         ``failed``: список, в который добавляются url, которые не удалось получить
+        """
 
-        reply_full = ''
-        for key in data:
-            if key in exclude:
-                continue
-            reply = '<b>Фильмы: </b>' if key in [KEY_MEGA_FILM, KEY_LORD_FILM] else '<b>Сериалы: </b>'
-
-            if key in [KEY_MEGA_FILM, KEY_MEGA_SERIAL]:
-                reply += '(Megashara)\n'
-            elif key == KEY_NEWSTUDIO:
-                reply += '(Newstudio)\n'
-            elif key == KEY_LORD_FILM:
-                reply += '(Lordsfilms)\n'
-
-            limit = num_last_release_per_site
-            if isinstance(data[key], list):
-                amount = limit if limit < len(data[key]) else len(data[key])
-                lst_urls = data[key][-amount:]
-            else:
-                lst_urls = []
-                for k_serial in data[key].keys():
-                    amount = limit if limit < len(data[key][k_serial]) else len(data[key][k_serial])
-                    lst_urls.extend(data[key][k_serial][-amount:])
+        reply = '<b>Фильмы: </b>' if key in [KEY_MEGA_FILM, KEY_LORD_FILM] else '<b>Сериалы: </b>'
+
+        if key in [KEY_MEGA_FILM, KEY_MEGA_SERIAL]:
+            reply += '(Megashara)\n'
+        elif key == KEY_NEWSTUDIO:
+            reply += '(Newstudio)\n'
+        elif key == KEY_LORD_FILM:
+            reply += '(Lordsfilms)\n'
 
-            lst_info = self.get_info_less(lst_urls)
-            if not lst_info:
-                lst_info = "Там все очень старое, даже выводить не буду..\n"
-            reply_full += reply + lst_info + '\n'
+        lst_info = self.get_info_less(lst_urls, failed) if lst_urls else ''
+        if not lst_info:
+            lst_info = "Там все очень старое, даже выводить не буду..\n"
+        return reply + lst_info + '\n'
 
-        if not reply_full:
-            reply_full = 'Релизов не найдено'
+    def get_last_reply(self, keys: List[str]) -> str:
+        """Строит ответ /last для сайтов keys, запрашивая релизы, которых нет в кэше"""
+
+        reply_full = ''.join(self.get_last_part(key, self.get_last_release_urls(key)) for key in keys)
+        return reply_full or 'Релизов не найдено'
+
+    def refresh_last_digest(self):
+        """Перестраивает устаревшие блоки готовых ответов /last"""
+
+        for key in self.last_digest.get_outdated():
+            try:
+                lst_urls = self.get_last_release_urls(key)
+                failed = []
+                part = self.get_last_part(key, lst_urls, failed)
+                if failed:
+                    # not cached: the block is built again on the next refresh
+                    self.logger.error(f'Releases are not fetched [DIGEST]: {key}, {len(failed)} of {len(lst_urls)}')
+                    self.last_digest.failed(key)
+                    continue
+
+                self.last_digest.set_part(key, part, lst_urls)
+
+            except Exception as error:
+                self.last_digest.failed(key)
+                self.logger.exception(f'{error} [DIGEST]: {key}')
+
+    def command_last(self, message: Message):
+        """Выводит данные о последних релизах с указанных сайтов"""
+
+        unique_code = message.text.split()[1] if len(message.text.split()) > 1 else None
+        keys = self.get_last_keys(unique_code)
+
+        reply_full = self.last_digest.get(keys)
+        if reply_full is None:
+            # digest is not built yet after start, identical requests are built once
+            reply_full = self.dispatcher.collapse(('last', tuple(keys)), self.get_last_reply, keys)
 
         self.bot.send_message(message.chat.id, reply_full, parse_mode='HTML')
 
@@ -626,8 +762,18 @@ class KinoReleaseBot:
             reply = 'У Вас нет прав на данную операцию'
         self.bot.send_message(chat_id, reply)
 
+    def command_stats(self, message: Message):
+        """Возвращает статистику времени работы этапов по сайтам"""
+
+        chat_id = message.chat.id
+        if chat_id == OWNER_ID:
+            reply = metrics.format_stats()
+        else:
+            reply = 'У Вас нет прав на данную операцию'
+        self.bot.send_message(chat_id, reply, parse_mode='HTML')
+
     def command_ping_site(self, message: Message):
-        """Возвращает статус код сайта"""
+        """Возвращает состояние сайта по последним запросам к нему, без запроса к сайту"""
 
         unique_code = message.text.split()[1] if len(message.text.split()) > 1 else None
 
@@ -647,9 +793,7 @@ class KinoReleaseBot:
             url = None
 
         if url:
-            response = requests.get(url, proxies=apihelper.proxy)
-            reply = f"Статус код: {response.status_code} {url}"
-            self.bot.send_message(message.chat.id, reply)
+            self.bot.send_message(message.chat.id, self.health.format_status(url))
 
         else:
             self.bot.reply_to(message, f'Хм.. может {self.get_command_code("help")}?')
@@ -661,26 +805,23 @@ class KinoReleaseBot:
         if len(msg_split) == 3:
             self.bot.reply_to(message, 'Получаю информацию о релизе..')
 
-            if msg_split[1] == self.get_site_code("mega_film"):
-                url = f'{sites[KEY_MEGA_FILM]}/{msg_split[2]}/'
-
-            elif msg_split[1] == self.get_site_code("mega_serial"):
-                url = f'{sites[KEY_MEGA_SERIAL]}/{msg_split[2]}/'
+            url = self.release_index.get(msg_split[1], msg_split[2])
 
-            elif msg_split[1] == self.get_site_code("lord_film"):
-                lord_urls_data = self.data_urls.get(KEY_LORD_FILM)
-                for u in lord_urls_data:
-                    if f'/{msg_split[2]}-' in u:
-                        url = u
-                        break
-                else:
-                    url = None
+            if not url and msg_split[2].isdigit():
+                # release is not seen by bot, but urls of megashara and newstudio are built from id
+                url_templates = {
+                    self.get_site_code("mega_film"): f'{sites[KEY_MEGA_FILM]}/{{}}/',
+                    self.get_site_code("mega_serial"): f'{sites[KEY_MEGA_SERIAL]}/{{}}/',
+                    self.get_site_code("newstudio"): 'http://newstudio.tv/viewtopic.php?t={}',
+                }
+                url_template = url_templates.get(msg_split[1])
+                url = url_template.format(msg_split[2]) if url_template else None
 
-            else:
-                url = None
+            if url and not self.health.allow(url) and not self.is_info_full_cached(url):
+                return self.bot.reply_to(message, 'Сайт временно недоступен, попробуйте позже')
 
             if url:
-                reply = self.get_info_full(url)
+                reply = self.dispatcher.collapse(('more', url), self.get_info_full, url)
                 if reply:
                     return self.bot.send_message(message.chat.id, reply, parse_mode='HTML')
 
@@ -688,163 +829,444 @@ class KinoReleaseBot:
 
         self.bot.reply_to(message, f'Хм.. может {self.get_command_code("help")}?')
 
-    def get_site_urls_for_parsing(self, site: str):
-        """parsing site, return list pars_urls"""
+    def get_site_urls_for_parsing(self, site: str, is_conditional: bool = True) -> Optional[list]:
+        """
+        parsing site, return list pars_urls or None if site is not available
+
+        **Args**:
+
+         ``site``: url страницы со списком релизов
+
+         ``is_conditional``: условный запрос: если страница не изменилась, возвращается пустой список
+        """
+
+        if not self.health.allow(site):
+            self.logger.debug(f'[CIRCUIT OPEN] [URL]: {site}')
+            return None
 
-        pars_urls = []
         try:
-            response = requests.get(site, timeout=300, proxies=apihelper.proxy)
-            soup = BeautifulSoup(response.content, 'html.parser')
+            with metrics.timer('listing_fetch', get_site(site)) as timing, self.health.track(site) as check:
+                headers = self.listing_validators.get_headers(site) if is_conditional else {}
+                response = requests.get(site, timeout=timeout_listing, proxies=apihelper.proxy, headers=headers)
+                check.status = response.status_code
+                if response.status_code >= 500:
+                    check.failed()
+
+                if is_conditional and self.listing_validators.is_unchanged(site, response.status_code,
+                                                                           response.content):
+                    self.logger.debug(f'[NOT MODIFIED] [URL]: {site}')
+                    return []
+
+                if response.status_code != 200:
+                    self.logger.info(f'[STATUS CODE]: {response.status_code} [URL]: {site}')
+                    timing.failed()
+                    return None
+
+            pars_urls = self.parse_site_urls(site, response.content)
+            if is_conditional:
+                self.listing_validators.update(site, response.headers, response.content)
+            return pars_urls
+
+        except requests.RequestException as error:
+            self.logger.error(f'{error}')
 
-            if response.status_code != 200:
-                self.logger.info(f'[STATUS CODE]: {response.status_code} [URL]: {site}')
+        except AttributeError:
+            self.logger.error(f'[URL]: {site}')
 
-            if 'megashara' in site:
-                pars_bl = soup.find('div', id='mid-side')
-                if not pars_bl:
-                    return pars_urls
+        return None
 
-                response = list(map(lambda x: f"{x.a['href']}",
-                                    pars_bl.findAll('div', class_='name-block')))[:num_pars_url_megashara]
+    async def async_get_site_urls_for_parsing(self, session, site: str, is_conditional: bool = True) -> Optional[list]:
+        """
+        Асинхронный парсинг страницы сайта со списком релизов, возвращает list pars_urls
+        или None, если сайт недоступен
 
-            elif 'newstudio' in site:
-                site_url = 'http://newstudio.tv'
-                response = list(map(lambda x: f"{site_url}{x.a['href'][1:]}",
-                                    soup.findAll('div', class_='topic-list')))[:num_pars_url_newstudio]
+        **Args**:
 
-            elif 'lordsfilm' in site:
-                response = list(map(lambda x: f"{x.a['href']}",
-                                    soup.find('div', id='dle-content')
-                                    .findAll('div', class_='short')))[:num_pars_url_lordsfilm]
+         ``session``: общая aiohttp-сессия
 
-            pars_urls = list(reversed(response))
+         ``site``: url страницы со списком релизов
 
-        except ReadTimeout as error:
-            self.logger.error(f'{error}')
+         ``is_conditional``: условный запрос: если страница не изменилась, возвращается пустой список
+        """
+
+        if not self.health.allow(site):
+            self.logger.debug(f'[CIRCUIT OPEN] [URL]: {site}')
+            return None
+
+        try:
+            self.logger.debug(f'Starting {site}')
+            timeout = aiohttp.ClientTimeout(total=timeout_listing)
+            headers = self.listing_validators.get_headers(site) if is_conditional else {}
+            with metrics.timer('listing_fetch', get_site(site)) as timing, self.health.track(site) as check:
+                async with session.get(site, proxy=proxy, timeout=timeout, headers=headers) as response:
+                    status = check.status = response.status
+                    html = await response.read()
+
+                if status >= 500:
+                    check.failed()
+
+                if is_conditional and self.listing_validators.is_unchanged(site, status, html):
+                    self.logger.debug(f'[NOT MODIFIED] [URL]: {site}')
+                    return []
+
+                if status != 200:
+                    self.logger.info(f'[STATUS CODE]: {status} [URL]: {site}')
+                    timing.failed()
+                    return None
+
+            pars_urls = await self.parse_pool.parse('listing_parse', site, KinoReleaseBot._parse_site_urls, site, html)
+            if is_conditional:
+                self.listing_validators.update(site, response.headers, html)
+            return pars_urls
+
+        except asyncio.TimeoutError:
+            self.logger.error(f'[TIMEOUT] [URL]: {site}')
+
+        except aiohttp.ClientError as error:
+            self.logger.error(f'{error} [URL]: {site}')
 
         except AttributeError:
             self.logger.error(f'[URL]: {site}')
-            time.sleep(10 * 60)
 
-        return pars_urls
+        return None
 
     @staticmethod
-    async def async_parsing_url(urls: List[str],
-                                is_single_request: bool) -> str:
+    def parse_site_urls(site: str, html) -> list:
+        """
+        Возвращает все url релизов со страницы сайта в хронологическом порядке (от старых к новым)
+
+        **Args**:
+
+         ``site``: url страницы со списком релизов
+
+         ``html``: страница с контентом
+        """
+
+        with metrics.timer('listing_parse', get_site(site)):
+            return KinoReleaseBot._parse_site_urls(site, html)
+
+    @staticmethod
+    def _parse_site_urls(site: str, html) -> list:
+        response = []
+
+        if 'megashara' in site:
+            soup = make_soup(html, ['#mid-side'])
+            pars_bl = soup.find('div', id='mid-side')
+            if not pars_bl:
+                return []
+
+            response = list(map(lambda x: f"{x.a['href']}",
+                                pars_bl.findAll('div', class_='name-block')))
+
+        elif 'newstudio' in site:
+            soup = make_soup(html, ['.topic-list'])
+            site_url = 'http://newstudio.tv'
+            response = list(map(lambda x: f"{site_url}{x.a['href'][1:]}",
+                                soup.findAll('div', class_='topic-list')))
+
+        elif 'lordsfilm' in site:
+            soup = make_soup(html, ['#dle-content'])
+            response = list(map(lambda x: f"{x.a['href']}",
+                                soup.find('div', id='dle-content')
+                                .findAll('div', class_='short')))
+
+        return list(reversed(response))
+
+    @staticmethod
+    def get_listing_page_url(k_site: str, url_site: str, page: int) -> str:
+        """Возвращает url страницы page списка релизов url_site (первая страница - сам url_site)"""
+
+        return url_site if page == 1 else listing_page_url[k_site](url_site, page)
+
+    def add_listing_page(self, k_site: str, k_serial: str, url_site: str, page: int,
+                         crawled: list, pars_urls: Optional[list]) -> tuple:
+        """
+        Добавляет все неизвестные url очередной страницы списка к уже прочитанным, возвращает (crawled, прочитан ли список).
+        Список прочитан, если на странице есть уже известный url, страница не изменилась или недоступна,
+        либо прочитано listing_max_pages страниц. crawled равен None, если список прочитать не удалось
+
+        **Args**:
+
+         ``k_site``, ``k_serial``, ``url_site``: страница со списком релизов из get_listing
+
+         ``page``: номер прочитанной страницы
+
+         ``crawled``: url предыдущих страниц в хронологическом порядке
+
+         ``pars_urls``: url страницы page или None, если она недоступна
+        """
+
+        if pars_urls is None:
+            if page > 1:
+                # the first page is read again on the next poll, the urls of the gap are not lost
+                self.listing_validators.forget(url_site)
+            return None, True
+
+        if page == 1 and not self.storage.get_last_urls(k_site, 1, k_serial):
+            # first start: only the latest releases, as many as num_pars_url_*
+            first_limit = {
+                KEY_MEGA_FILM: num_pars_url_megashara,
+                KEY_MEGA_SERIAL: num_pars_url_megashara,
+                KEY_LORD_FILM: num_pars_url_lordsfilm,
+                KEY_NEWSTUDIO: num_pars_url_newstudio,
+            }.get(k_site, len(pars_urls))
+
+            # the older releases of the page are stored as seen, otherwise the next poll alerts them as new
+            older_urls = self.storage.add_new_urls(k_site, pars_urls[:-first_limit], k_serial)
+            self.index_release_urls(k_site, older_urls)
+            return pars_urls[-first_limit:], True
+
+        # the whole page is checked: pinned or bumped releases put known urls above the new ones
+        new_urls = [url for url in pars_urls if not self.storage.has_url(k_site, url, k_serial)]
+        is_known_found = len(new_urls) < len(pars_urls)
+
+        crawled = new_urls + crawled
+        if is_known_found or not pars_urls:
+            return crawled, True
+
+        if page >= listing_max_pages:
+            self.logger.info(f'No known urls on {page} pages, the crawl is stopped [URL]: {url_site}')
+            return crawled, True
+
+        return crawled, False
+
+    def crawl_listing(self, k_site: str, k_serial: str, url_site: str) -> Optional[list]:
+        """Читает страницы списка релизов, пока не прочитает страницу с известным url, возвращает pars_urls или None"""
+
+        crawled = []
+        for page in range(1, listing_max_pages + 1):
+            pars_urls = self.get_site_urls_for_parsing(self.get_listing_page_url(k_site, url_site, page),
+                                                       is_conditional=page == 1)
+            crawled, is_done = self.add_listing_page(k_site, k_serial, url_site, page, crawled, pars_urls)
+            if is_done:
+                break
+        return crawled
+
+    async def async_crawl_listing(self, session, k_site: str, k_serial: str, url_site: str) -> Optional[list]:
+        """Асинхронно читает страницы списка релизов, пока не прочитает страницу с известным url"""
+
+        crawled = []
+        for page in range(1, listing_max_pages + 1):
+            pars_urls = await self.async_get_site_urls_for_parsing(
+                session, self.get_listing_page_url(k_site, url_site, page), is_conditional=page == 1
+            )
+            crawled, is_done = self.add_listing_page(k_site, k_serial, url_site, page, crawled, pars_urls)
+            if is_done:
+                break
+        return crawled
+
+    async def async_crawl_site(self, k_site: str, k_serial: str, url_site: str) -> Optional[list]:
+        session = await self.runtime.get_session()
+        return await self.async_crawl_listing(session, k_site, k_serial, url_site)
+
+    def crawl_sites(self, listing: List[tuple]) -> Iterator[tuple]:
+        """
+        Обходит списки релизов и возвращает (элемент listing, pars_urls) по мере готовности каждого списка,
+        так что медленный сайт не задерживает обработку остальных. Для недоступных списков pars_urls - None
+
+        **Args**:
+
+         ``listing``: списки релизов (k_site, k_serial, url страницы) из get_listing
+        """
+
+        try:
+            if not async_crawl:
+                for item in listing:
+                    yield item, self.crawl_listing(*item)
+            else:
+                # all listings are crawled concurrently, results are handled in the calling thread
+                futures = {self.runtime.submit(self.async_crawl_site(*item)): item for item in listing}
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+        finally:
+            self.listing_validators.save()
+
+    @staticmethod
+    async def async_parsing_url(session,
+                                urls: List[str],
+                                is_single_request: bool,
+                                is_less_info: bool = True,
+                                cache: ReleaseCache = None,
+                                failed: List[str] = None) -> str:
         """
         Асинхронный парсинг url
 
         **Args**:
 
+         ``session``: общая aiohttp-сессия
+
          ``urls``: url, подлежащие парсингу
 
           ``is_single_request``: является ли запрос на получение одиночным или входит в состав для парсинга
+
+          ``is_less_info``: нужна ли только сокращенная информация о релизе
+
+          ``cache``: кэш разобранных релизов, url из кэша не запрашиваются повторно
+
+          ``failed``: список, в который добавляются url, которые не удалось получить
         """
 
         if not urls:
             return ''
 
+        replies = {}
+        releases = []
+        for url in urls:
+            release = Release(url, is_single_request, is_less_info, cache=cache)
+            reply = release.get_cached_info()
+            if reply is None:
+                releases.append(release)
+            else:
+                replies[url] = reply
+
         tasks = []
+        for i, release in enumerate(releases):
+            if i:
+                await asyncio.sleep(0.2 if (i - 1) % 5 != 0 else 1)
+            tasks.append(asyncio.ensure_future(release.async_get_info(session)))
+
+        result = await asyncio.gather(*tasks)
+        for release, reply in zip(releases, result):
+            if reply is None and failed is not None:
+                failed.append(release.url)
+            replies[release.url] = reply or ''
+
+        return ''.join(replies[url] for url in urls)
 
-        async with aiohttp.ClientSession() as session:
-            for i, url in enumerate(urls):
-                task = asyncio.ensure_future(Release(url, is_single_request).async_get_info(session))
-                tasks.append(task)
-                await asyncio.sleep(0.2 if i % 5 != 0 else 1)
-            result = await asyncio.gather(*tasks)
+    async def async_get_info_less(self, urls: List[str], failed: List[str] = None) -> str:
+        """Асинхронно получает короткое описание релизов, запросы к разным сайтам идут параллельно"""
 
-        return ''.join(result)
+        session = await self.runtime.get_session()
+        is_single_request = len(urls) == 1
+
+        tasks = [
+            self.async_parsing_url(session,
+                                   urls=[url for url in urls if site in url],
+                                   is_single_request=is_single_request,
+                                   cache=self.release_cache,
+                                   failed=failed)
+            for site in ['megashara', 'lordsfilm', 'newstudio']
+        ]
+        return ''.join(await asyncio.gather(*tasks))
 
-    def get_info_less(self, urls: Union[str, list]):
+    def get_info_less(self, urls: Union[str, list], failed: List[str] = None):
         """
         Возвращает короткое описание релиза
 
         **Args**:
 
          ``urls``: url для парсинга, может быть как строкой (одиночный url), так и списком url
+
+         ``failed``: список, в который добавляются url, которые не удалось получить
         """
 
         # convert in list if input url is string
         if isinstance(urls, str):
             urls = [urls]
 
-        is_single_request = len(urls) == 1
-        urls_megashara = [url for url in urls if 'megashara' in url]
-        urls_lordsfilm = [url for url in urls if 'lordsfilm' in url]
-        urls_newstudio = [url for url in urls if 'newstudio' in url]
-
-        loop = asyncio.new_event_loop()
-
-        tasks = [
-            loop.create_task(self.async_parsing_url(urls=urls_megashara,
-                                                    is_single_request=is_single_request)),
-
-            loop.create_task(self.async_parsing_url(urls=urls_lordsfilm,
-                                                    is_single_request=is_single_request)),
-
-            loop.create_task(self.async_parsing_url(urls=urls_newstudio,
-                                                    is_single_request=is_single_request)),
-        ]
-
-        done, _ = loop.run_until_complete(asyncio.wait(tasks))
-        loop.close()
+        return self.runtime.run(self.async_get_info_less(urls, failed))
 
-        reply = ''
-        for d in done:
-            reply += d.result() if d.result() else ''
-        return reply
+    async def async_get_info_full(self, url: str) -> str:
+        session = await self.runtime.get_session()
+        return await self.async_parsing_url(session, [url], is_single_request=True, is_less_info=False,
+                                            cache=self.release_cache)
 
     def get_info_full(self, url) -> str:
         """Возвращает подробное описание о релизе"""
 
+        reply = Release(url, is_single_request=True, is_less_info=False, cache=self.release_cache).get_cached_info()
+        if reply is not None:
+            return reply
+
         try:
-            return str(Release(url, is_single_request=True, is_less_info=False).get_info())
+            return self.runtime.run(self.async_get_info_full(url))
 
         except Exception as error:
             self.logger.exception(f"{error} [URL]: {url}")
             return 'Ошибка при получении подробной информации'
 
-    def get_new_urls(self) -> list:
-        """Определяет есть ли новые url и возвращает данные"""
+    def is_info_full_cached(self, url: str) -> bool:
+        return self.release_cache.get(url, is_less_info=False) is not None
 
-        if self.data_urls is None:
-            data_urls: dict = self.load_json(self.file_data_url)
-        else:
-            data_urls = self.data_urls
+    def prefetch_info_full(self, url: str):
+        """Получает подробное описание релиза в кэш, совпадающий запрос /more дождется этого же результата"""
 
-        _new_urls: List[str] = []
+        self.dispatcher.collapse(('more', url), self.get_info_full, url)
 
-        self.logger.info('Start update')
+    @staticmethod
+    def get_listing() -> List[tuple]:
+        """Возвращает страницы со списками релизов в порядке обхода: (k_site, k_serial, url страницы)"""
 
+        listing = []
         for k_site in sites.keys():
             if isinstance(sites[k_site], str):
-                if not data_urls.get(k_site):
-                    data_urls[k_site] = []
-
-                pars_urls = self.get_site_urls_for_parsing(site=sites[k_site])
-                for url in pars_urls:
-                    if url not in data_urls[k_site]:
-                        _new_urls.append(url)
-                        data_urls[k_site].append(url)
+                listing.append((k_site, '', sites[k_site]))
             else:
-                if not data_urls.get(k_site):
-                    data_urls[k_site] = {}
-
                 for url_serial in sites[k_site]:
                     k_serial = re.findall(r'\?f=(\d+)', url_serial)[0]
-                    if not data_urls[k_site].get(k_serial):
-                        data_urls[k_site][k_serial] = []
+                    listing.append((k_site, k_serial, url_serial))
+        return listing
 
-                    pars_urls = self.get_site_urls_for_parsing(site=url_serial)
-                    for url in pars_urls:
-                        if url not in data_urls[k_site][k_serial]:
-                            _new_urls.append(url)
-                            data_urls[k_site][k_serial].append(url)
+    def get_new_urls(self, listing: List[tuple] = None, on_new: Callable = None) -> list:
+        """
+        Определяет есть ли новые url и возвращает данные
+
+        **Args**:
+
+         ``listing``: страницы для обхода (k_site, k_serial, url страницы), по умолчанию - все
+
+         ``on_new``: вызывается с новыми url каждой страницы сразу после ее обхода, не дожидаясь остальных
+        """
+
+        if listing is None:
+            listing = self.get_listing()
+
+        _new_urls: List[str] = []
+
+        self.logger.info('Start update')
+
+        for (k_site, k_serial, url_site), pars_urls in self.crawl_sites(listing):
+            new_urls = self.storage.add_new_urls(k_site, pars_urls, k_serial) if pars_urls else []
+            self.index_release_urls(k_site, new_urls)
+            if new_urls:
+                self.last_digest.mark_dirty(k_site)
+            self.poll_scheduler.report(url_site, is_failed=pars_urls is None, is_new_found=bool(new_urls))
+            _new_urls.extend(new_urls)
+
+            if new_urls and on_new is not None:
+                on_new(new_urls)
 
         self.logger.info(f'Update done, new_data = {bool(_new_urls)}')
 
         return _new_urls
 
+    def on_torrent_resolved(self, url: str, torrent_url: str):
+        """Дополняет кэш и уже разосланные оповещения ссылкой на торрент-файл, полученной позже"""
+
+        # runs on the event loop: the cache file is written by update_data
+        if not self.release_cache.update(url, {'torrent': torrent_url}):
+            return
+
+        reply = Release(url, is_single_request=True, cache=self.release_cache).get_cached_info()
+        if reply:
+            self.broadcaster.edit_delivered(url, reply, parse_mode='HTML')
+
+    def index_release_urls(self, k_site: str, urls: List[str]):
+        """Добавляет url релизов сайта в индекс id -> url"""
+
+        for url in urls:
+            release_id = Release.get_release_id(url)
+            if release_id:
+                self.release_index.add(self.get_site_code_by_key(k_site, url), release_id, url)
+
+    def unindex_release_urls(self, k_site: str, urls: List[str]):
+        """Удаляет url релизов сайта, удаленные из хранилища, из индекса id -> url"""
+
+        for url in urls:
+            release_id = Release.get_release_id(url)
+            if release_id:
+                self.release_index.remove(self.get_site_code_by_key(k_site, url), release_id, url)
+
     def listener(self, messages):
         """When new messages arrive TeleBot will call this function."""
         for m in messages:
@@ -856,26 +1278,36 @@ class KinoReleaseBot:
                     m.text,
                 ))
 
-                if m.text.startswith(self.get_command_code('start')):
-                    self.command_start(m)
+                self.dispatch(m)
 
-                elif m.text.startswith(self.get_command_code('ip')):
-                    self.command_ip(m)
+    def dispatch(self, message: Message):
+        """Передает команду в пул потоков: быстрые команды не ждут выполнения медленных"""
 
-                elif m.text.startswith(self.get_command_code('help')):
-                    self.command_help(m)
-
-                elif m.text.startswith(self.get_command_code('last')):
-                    self.command_last(m)
+        fast_commands = {
+            self.get_command_code('start'): self.command_start,
+            self.get_command_code('help'): self.command_help,
+            self.get_command_code('stats'): self.command_stats,
+        }
+        slow_commands = {
+            self.get_command_code('ip'): self.command_ip,
+            self.get_command_code('last'): self.command_last,
+            self.get_command_code('ping_site'): self.command_ping_site,
+            self.get_command_code('more_film'): self.command_more_film,
+        }
 
-                elif m.text.startswith(self.get_command_code('ping_site')):
-                    self.command_ping_site(m)
+        for code, handler in fast_commands.items():
+            if message.text.startswith(code):
+                return self.dispatcher.submit_fast(self.profiled(handler.__name__, handler), message)
 
-                elif m.text.startswith(self.get_command_code('more_film')):
-                    self.command_more_film(m)
+        for code, handler in slow_commands.items():
+            if message.text.startswith(code):
+                handler = self.profiled(handler.__name__, handler)
+                if not self.dispatcher.submit_slow(message.chat.id, handler, message):
+                    self.dispatcher.submit_fast(self.bot.reply_to, message,
+                                                'Подождите, предыдущий запрос еще выполняется..')
+                return
 
-                else:
-                    self.bot.reply_to(m, f'Хм.. может {self.get_command_code("help")}?')
+        self.dispatcher.submit_fast(self.bot.reply_to, message, f'Хм.. может {self.get_command_code("help")}?')
 
     def update_data(self, skip_first_alert: bool):
         """
@@ -888,38 +1320,67 @@ class KinoReleaseBot:
 
         while True:
             try:
-                new_data = self.get_new_urls()
-
-                if new_data:
-                    if skip_first_alert is True:
-                        time.sleep(timeout_upd_first)
-                        skip_first_alert = False
-                    else:
-                        for url in new_data:
-                            if url.startswith(sites.get(KEY_MEGA_SERIAL, 'None')):
-                                continue
-
-                            reply = self.get_info_less(url)
-                            if reply:
-                                for chat in self.data_chats.keys():
-                                    try:
-                                        self.bot.send_message(int(chat), reply, parse_mode='HTML')
-                                    except Exception as error:
-                                        self.logger.info(f'Не могу отправить {int(chat)} {error}')
-                    self.dump_json(self.file_data_url, self.data_urls)
-
-                time.sleep(timeout_upd)
+                new_data = self.profiled('update_cycle', self.update_cycle)(is_alert=not skip_first_alert)
+                self.refresh_last_digest()
+                # the release cache file is written once per cycle, not on every parsed release
+                self.release_cache.save()
+                if new_data and skip_first_alert is True:
+                    time.sleep(timeout_upd_first)
+                    skip_first_alert = False
+
+                time.sleep(self.poll_scheduler.get_wait_time())
 
             except Exception as error:
                 self.logger.error(error)
                 time.sleep(2 * 60)
 
+    def update_cycle(self, is_alert: bool = True) -> list:
+        """
+        Один цикл обновления: обход страниц, которые пора опросить, и рассылка оповещений о новых релизах.
+        Возвращает новые url
+
+        **Args**:
+
+        ``is_alert``: рассылать ли оповещения о новых релизах
+        """
+
+        listing = self.get_listing()
+        self.poll_scheduler.set_sources(url_site for _, _, url_site in listing)
+        due = self.poll_scheduler.get_due()
+        listing = [item for item in listing if item[2] in due]
+        new_data = self.get_new_urls(listing, on_new=self.alert if is_alert else None) if listing else []
+
+        if new_data:
+            for k_site, urls in self.storage.prune(storage_retention).items():
+                self.unindex_release_urls(k_site, urls)
+
+        return new_data
+
+    def alert(self, new_urls: List[str]):
+        """Рассылает оповещения о новых релизах"""
+
+        for url in new_urls:
+            if url.startswith(sites.get(KEY_MEGA_SERIAL, 'None')):
+                continue
+
+            reply = self.get_info_less(url)
+            if reply:
+                chats = [int(chat) for chat in self.storage.get_chats().keys()]
+                self.broadcaster.broadcast(chats, reply, parse_mode='HTML', tag=url)
+
+                # newstudio has no full info, /more replies with the alert
+                if prefetch_full_info and 'newstudio' not in url:
+                    self.prefetcher.schedule(url)
+
     def start(self, skip_first_alert: bool):
         """Запуск бота"""
 
         self.bot.set_update_listener(self.listener)
         self.bot.send_message(OWNER_ID, 'Я запущен заново')
 
+        if metrics_port:
+            start_metrics_server(metrics, metrics_host, metrics_port)
+
         threading.Thread(name='Update-pars', target=self.update_data, args=[skip_first_alert, ]).start()
 
         while True:
@@ -934,6 +1395,10 @@ class KinoReleaseBot:
                 # сработает, если polling остановить вручную
                 break
 
+        self.release_cache.save()
+        self.runtime.close()
+        self.parse_pool.close()
+
 
 def parse_cli_args():
     """Разбор аргументов, передаваемых интерфейсом командной строки"""
@@ -953,11 +1418,15 @@ def parse_cli_args():
                         default=True,
                         type=lambda x: str(x).capitalize() == 'True')
 
+    parser.add_argument('--profile',
+                        help='Profile sampled update cycles and commands, reports are written to logs/',
+                        action="store_true")
+
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_cli_args()
 
-    bot = KinoReleaseBot(debug=args.debug, logs_show=args.logs_show)
+    bot = KinoReleaseBot(debug=args.debug, logs_show=args.logs_show, profile=args.profile)
     bot.start(args.skip_first_alert)
@@ -0,0 +1,187 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# upper bounds of latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+SITES = ('megashara', 'lordsfilm', 'newstudio', 'kinopoisk', 'telegram')
+
+
+def get_site(url: str) -> str:
+    """Возвращает название сайта для меток метрик по url"""
+
+    for site in SITES:
+        if site in url:
+            return site
+    return 'other'
+
+
+class Timing:
+    """Замер одного вызова внутри Metrics.timer"""
+
+    def __init__(self):
+        self.is_error = False
+
+    def failed(self):
+        """Отмечает вызов как завершившийся ошибкой"""
+
+        self.is_error = True
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы длительности этапов работы бота (получение страниц, разбор, рейтинг,
+    трейлер, отправка в telegram) по сайтам. Потокобезопасные.
+    """
+
+    def __init__(self, prefix: str = 'kino'):
+        self.prefix = prefix
+        self.started = time.time()
+
+        self._lock = threading.Lock()
+        self._stages = {}  # (stage, site) -> {'count', 'errors', 'sum', 'max', 'buckets'}
+
+    def observe(self, stage: str, site: str, seconds: float, is_error: bool = False):
+        """
+        Учитывает один вызов этапа
+
+        **Args**:
+
+         ``stage``: этап, например listing_fetch
+
+         ``site``: сайт, к которому относится вызов
+
+         ``seconds``: длительность вызова
+
+         ``is_error``: завершился ли вызов ошибкой
+        """
+
+        with self._lock:
+            item = self._stages.get((stage, site))
+            if item is None:
+                item = self._stages[(stage, site)] = {
+                    'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(BUCKETS) + 1),
+                }
+
+            item['count'] += 1
+            item['errors'] += int(is_error)
+            item['sum'] += seconds
+            item['max'] = max(item['max'], seconds)
+            item['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    @contextmanager
+    def timer(self, stage: str, site: str):
+        """Замеряет длительность блока with, исключение в блоке считается ошибкой"""
+
+        timing = Timing()
+        start = time.perf_counter()
+        try:
+            yield timing
+        except BaseException:
+            timing.failed()
+            raise
+        finally:
+            self.observe(stage, site, time.perf_counter() - start, timing.is_error)
+
+    def get_snapshot(self) -> dict:
+        with self._lock:
+            return {key: dict(item, buckets=list(item['buckets'])) for key, item in self._stages.items()}
+
+    @staticmethod
+    def get_quantile(item: dict, q: float) -> float:
+        """Оценка квантиля по гистограмме (верхняя граница корзины, в которую он попадает)"""
+
+        rank = q * item['count']
+        total = 0
+        for bound, count in zip(BUCKETS + (item['max'],), item['buckets']):
+            total += count
+            if total >= rank:
+                return min(bound, item['max'])
+        return item['max']
+
+    def format_stats(self) -> str:
+        """Возвращает сводку по этапам для команды /stats"""
+
+        snapshot = self.get_snapshot()
+        if not snapshot:
+            return 'Статистики пока нет'
+
+        uptime = int(time.time() - self.started)
+        lines = [f'<b>Статистика</b> (за {uptime // 3600}ч {uptime % 3600 // 60}мин)\n']
+        for (stage, site), item in sorted(snapshot.items()):
+            avg = item['sum'] / item['count']
+            lines.append(
+                f"{stage} [{site}]: {item['count']} шт., ошибок {item['errors']}, "
+                f"ср. {avg:.2f}с, p95 {self.get_quantile(item, 0.95):.2f}с, макс. {item['max']:.2f}с"
+            )
+        return '\n'.join(lines)
+
+    def render_prometheus(self) -> str:
+        """Возвращает метрики в текстовом формате Prometheus"""
+
+        name = f'{self.prefix}_stage_duration_seconds'
+        errors = f'{self.prefix}_stage_errors_total'
+        lines = [
+            f'# HELP {name} Duration of bot stages by site.',
+            f'# TYPE {name} histogram',
+        ]
+        snapshot = sorted(self.get_snapshot().items())
+        for (stage, site), item in snapshot:
+            labels = f'stage="{stage}",site="{site}"'
+            total = 0
+            for bound, count in zip(BUCKETS, item['buckets']):
+                total += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {item["count"]}')
+            lines.append(f'{name}_sum{{{labels}}} {item["sum"]:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {item["count"]}')
+
+        lines.append(f'# HELP {errors} Failed calls of bot stages by site.')
+        lines.append(f'# TYPE {errors} counter')
+        for (stage, site), item in snapshot:
+            lines.append(f'{errors}{{stage="{stage}",site="{site}"}} {item["errors"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(metrics_: Metrics, host: str, port: int) -> HTTPServer:
+    """
+    Запускает в фоновом потоке http-сервер, который отдает метрики в формате Prometheus на /metrics
+
+    **Args**:
+
+     ``metrics_``: метрики
+
+     ``host``, ``port``: адрес сервера
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            content = metrics_.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    server = _ThreadingServer((host, port), Handler)
+    threading.Thread(name='Metrics-server', target=server.serve_forever, daemon=True).start()
+    return server
+
+
+metrics = Metrics()
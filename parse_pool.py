@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from metrics import metrics, get_site
+
+
+def timed_call(func: Callable, *args) -> tuple:
+    """Вызывает func(*args) в процессе пула, возвращает (результат, длительность в секундах)"""
+
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class ParsePool:
+    """
+    Разбор страниц в пуле процессов: цикл событий только скачивает страницы и передает html в пул,
+    разбор разных страниц идет на разных ядрах. Функции разбора и их результаты должны быть picklable.
+    При workers = 0 страницы разбираются в цикле событий.
+    """
+
+    def __init__(self, workers: Optional[int]):
+        """
+        **Args**:
+
+         ``workers``: число процессов разбора, 0 - разбор без пула, None - на один меньше числа ядер
+        """
+
+        self.logger = logging.getLogger('main')
+        self.workers = workers if workers is not None else max(0, (os.cpu_count() or 1) - 1)
+
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """Пул процессов, создается при первом разборе"""
+
+        with self._lock:
+            if self._executor is None:
+                # the bot process already runs threads (event loop, logging, pools): fork would copy their locks
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    async def parse(self, stage: str, url: str, func: Callable, *args):
+        """
+        Выполняет func(*args) в пуле процессов и учитывает длительность разбора в метриках
+
+        **Args**:
+
+         ``stage``: этап для метрик, например release_parse
+
+         ``url``: url страницы, по нему определяется сайт для метрик
+
+         ``func``: функция разбора, доступная по имени модуля (picklable)
+        """
+
+        if not self.workers:
+            with metrics.timer(stage, get_site(url)):
+                return func(*args)
+
+        executor = self.get_executor()
+        loop = asyncio.get_event_loop()
+        try:
+            result, seconds = await loop.run_in_executor(executor, timed_call, func, *args)
+
+        except BrokenProcessPool as error:
+            # a worker has died, the pool is created again for the next pages
+            self.logger.error(f'{error!r} [URL]: {url}')
+            self._reset(executor)
+            with metrics.timer(stage, get_site(url)):
+                return func(*args)
+
+        except Exception:
+            metrics.observe(stage, get_site(url), 0.0, is_error=True)
+            raise
+
+        metrics.observe(stage, get_site(url), seconds)
+        return result
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,161 @@
+"""
+Построение дерева BeautifulSoup для парсеров релизов.
+
+Бэкенд выбирается в settings.html_parser:
+
+ ``html.parser``: встроенный парсер python
+
+ ``lxml``: парсер lxml (в разы быстрее html.parser)
+
+ ``selectolax``: нужные контейнеры вырезаются из страницы selectolax, в BeautifulSoup передаются только они
+
+Если библиотека бэкенда не установлена, используется html.parser.
+Разбор ограничивается контейнерами, которые читают парсеры (#mid-side, .fmain, .accordion-inner и т.д.),
+остальная часть страницы в дерево не попадает.
+"""
+
+import sys
+from typing import List, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+from settings import html_parser
+
+try:
+    import lxml  # noqa: F401
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser
+    except ImportError:
+        HTMLParser = None
+
+BACKENDS = ('html.parser', 'lxml', 'selectolax')
+
+
+def get_available_backend(name: str) -> str:
+    """Возвращает бэкенд name, если его библиотека установлена, иначе html.parser"""
+
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown html parser backend: {name}')
+
+    # not logged here: the module is imported before logging is set up and again in every parse process
+    if (name == 'lxml' and lxml is None) or (name == 'selectolax' and HTMLParser is None):
+        return 'html.parser'
+
+    return name
+
+
+backend = get_available_backend(html_parser)
+restrict_to_containers = True
+
+
+def set_backend(name: str):
+    """Переключает бэкенд для всех последующих разборов"""
+
+    global backend
+    backend = get_available_backend(name)
+
+
+def get_strainer(containers: List[str]) -> SoupStrainer:
+    """
+    Возвращает фильтр BeautifulSoup, пропускающий только контейнеры (с их содержимым)
+
+    **Args**:
+
+     ``containers``: css-селекторы контейнеров одного вида: только '#id' или только '.class'
+    """
+
+    ids = [c[1:] for c in containers if c.startswith('#')]
+    classes = [c[1:] for c in containers if c.startswith('.')]
+
+    if len(ids) + len(classes) != len(containers) or (ids and classes):
+        raise ValueError(f'Containers must be all "#id" or all ".class": {containers}')
+
+    return SoupStrainer(id=ids) if ids else SoupStrainer(class_=classes)
+
+
+def make_soup(html, containers: Optional[List[str]] = None, name: Optional[str] = None) -> BeautifulSoup:
+    """
+    Строит дерево BeautifulSoup выбранным бэкендом
+
+    **Args**:
+
+     ``html``: страница с контентом (str или bytes)
+
+     ``containers``: css-селекторы контейнеров, которыми ограничивается разбор. None - разбирается вся страница
+
+     ``name``: бэкенд, по умолчанию - выбранный в настройках
+    """
+
+    name = name or backend
+    if not restrict_to_containers:
+        containers = None
+
+    if name == 'selectolax' and containers:
+        if isinstance(html, bytes):
+            html = UnicodeDammit(html).unicode_markup
+
+        tree = HTMLParser(html)
+        fragment = ''.join(node.html for node in tree.css(', '.join(containers)))
+        return BeautifulSoup(fragment, 'lxml' if lxml is not None else 'html.parser')
+
+    if name == 'selectolax':
+        name = 'lxml' if lxml is not None else 'html.parser'
+
+    parse_only = get_strainer(containers) if containers else None
+    return BeautifulSoup(html, name, parse_only=parse_only)
+
+
+def compare_backends(pages: List[tuple]) -> bool:
+    """
+    Сверяет данные релизов (ReleaseInfo), разобранных каждым доступным бэкендом, с разбором всей страницы html.parser.
+    Выводит расхождения, возвращает True, если их нет.
+
+    **Args**:
+
+     ``pages``: пары (url релиза, путь к сохраненной странице)
+    """
+
+    from main import Release
+
+    def parse(url, html):
+        return Release.parsing(url, html, is_less_info=False)
+
+    global backend, restrict_to_containers
+    current = backend
+    is_same = True
+    try:
+        for url, path in pages:
+            with open(path, 'rb') as file:
+                html = file.read()
+
+            backend, restrict_to_containers = 'html.parser', False
+            expected = parse(url, html)
+            restrict_to_containers = True
+
+            for name in BACKENDS:
+                backend = get_available_backend(name)
+                if backend != name:
+                    continue
+
+                result = parse(url, html)
+                if result != expected:
+                    is_same = False
+                    print(f'[{name}] {url}:\n  expected {expected}\n  got      {result}')
+    finally:
+        backend, restrict_to_containers = current, True
+
+    return is_same
+
+
+if __name__ == '__main__':
+    # python parser_backend.py URL PAGE.html [URL PAGE.html ...]
+    from parser_backend import compare_backends  # the module that main uses, not __main__
+
+    args = sys.argv[1:]
+    sys.exit(0 if compare_backends(list(zip(args[::2], args[1::2]))) else 1)
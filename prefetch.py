@@ -0,0 +1,84 @@
+import logging
+import queue
+import threading
+from typing import Callable
+from urllib.parse import urlsplit
+
+from broadcast import RateLimiter
+from metrics import metrics, get_site
+
+
+class Prefetcher:
+    """
+    Фоновое получение полной информации о новых релизах до первой команды /more.
+    Релизы обрабатываются по одному в отдельном потоке с низким приоритетом: запросы к каждому хосту
+    ограничены своим лимитом, при переполнении очереди новые url отбрасываются.
+    """
+
+    def __init__(self, fetch: Callable, is_cached: Callable, rate_per_host: float, queue_size: int):
+        """
+        **Args**:
+
+         ``fetch``: функция fetch(url), получающая полную информацию о релизе и сохраняющая ее в кэш
+
+         ``is_cached``: функция is_cached(url) -> есть ли полная информация о релизе в кэше
+
+         ``rate_per_host``: запросов в секунду к одному хосту
+
+         ``queue_size``: максимальное число url в очереди
+        """
+
+        self.logger = logging.getLogger('main')
+        self.fetch = fetch
+        self.is_cached = is_cached
+        self.rate_per_host = rate_per_host
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._limiters = {}  # host -> RateLimiter
+        self._thread = None
+
+    def schedule(self, url: str):
+        """Ставит url в очередь, если его там еще нет"""
+
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+
+            if self._thread is None:
+                self._thread = threading.Thread(name='Prefetch', target=self._run, daemon=True)
+                self._thread.start()
+
+        try:
+            self._queue.put_nowait(url)
+        except queue.Full:
+            self.logger.info(f'Prefetch queue is full, skipped: {url}')
+            with self._lock:
+                self._pending.discard(url)
+
+    def get_limiter(self, url: str) -> RateLimiter:
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate_per_host, burst=1)
+            return limiter
+
+    def _run(self):
+        while True:
+            url = self._queue.get()
+            try:
+                if not self.is_cached(url):
+                    self.get_limiter(url).acquire()
+                    with metrics.timer('prefetch', get_site(url)):
+                        self.fetch(url)
+                    self.logger.debug(f'Prefetched {url}')
+
+            except Exception as error:
+                self.logger.exception(f'{error} [URL]: {url}')
+
+            finally:
+                with self._lock:
+                    self._pending.discard(url)
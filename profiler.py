@@ -0,0 +1,132 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from runtime import AsyncRuntime
+
+
+class Profiler:
+    """
+    Выборочное профилирование циклов обновления и команд (cProfile + tracemalloc).
+    Профилируется каждый sample_every-й вызов с одним названием, чтобы накладные расходы
+    оставались допустимыми для работы в production. Отчет о самых затратных функциях
+    и местах выделения памяти записывается в отдельный файл в dir_.
+    """
+
+    def __init__(self, dir_: str, sample_every: int, top_n: int, runtime: AsyncRuntime = None):
+        """
+        **Args**:
+
+         ``dir_``: директория отчетов
+
+         ``sample_every``: профилируется каждый sample_every-й вызов с одним названием
+
+         ``top_n``: число функций и мест выделения памяти в отчете
+
+         ``runtime``: фоновый цикл событий, его поток профилируется вместе с вызывающим
+        """
+
+        self.logger = logging.getLogger('main')
+        self.dir = dir_
+        self.sample_every = max(1, sample_every)
+        self.top_n = top_n
+        self.runtime = runtime
+
+        self._lock = threading.Lock()
+        self._calls = {}  # name -> число вызовов
+        self._is_active = False  # профилируется только один вызов одновременно
+
+    def _get_sampled_call(self, name: str) -> Optional[int]:
+        """Возвращает номер вызова, если он попал в выборку, иначе None"""
+
+        with self._lock:
+            calls = self._calls[name] = self._calls.get(name, 0) + 1
+            if self._is_active or (calls - 1) % self.sample_every:
+                return None
+            self._is_active = True
+            return calls
+
+    @contextmanager
+    def profile(self, name: str):
+        """Профилирует блок with, если вызов попал в выборку"""
+
+        call = self._get_sampled_call(name)
+        if call is None:
+            yield
+            return
+
+        profiles = [cProfile.Profile()]
+        if self.runtime:
+            # aiohttp requests and parsing run in the event loop thread
+            profiles.append(cProfile.Profile())
+            self.runtime.call(profiles[-1].enable)
+
+        is_tracing = not tracemalloc.is_tracing()
+        if is_tracing:
+            tracemalloc.start(10)
+
+        start = time.perf_counter()
+        profiles[0].enable()
+        try:
+            yield
+        finally:
+            profiles[0].disable()
+            duration = time.perf_counter() - start
+            if self.runtime:
+                self.runtime.call(profiles[-1].disable)
+
+            snapshot, peak = None, 0
+            if is_tracing:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            try:
+                self.write_report(f'{name}_{call}', duration, profiles, snapshot, peak)
+            except Exception as error:
+                self.logger.exception(f'{error} [PROFILE]: {name}')
+            finally:
+                with self._lock:
+                    self._is_active = False
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """Возвращает func, вызовы которой профилируются под названием name"""
+
+        def wrapper(*args, **kwargs):
+            with self.profile(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def write_report(self, name: str, duration: float, profiles: list, snapshot, peak: int):
+        stream = io.StringIO()
+        stream.write(f'{name}: {duration:.3f}s, peak traced memory {peak / 1024:.1f} KiB\n\n')
+
+        stats = pstats.Stats(profiles[0], stream=stream)
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        stats.sort_stats('tottime').print_stats(self.top_n)
+
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            stream.write(f'Top {self.top_n} allocation sites:\n')
+            for stat in snapshot.statistics('lineno')[:self.top_n]:
+                stream.write(f'{stat}\n')
+
+        filename = os.path.join(self.dir, f'profile_{name}_{time.strftime("%Y%m%d_%H%M%S")}.txt')
+        with open(filename, 'w', encoding='utf-8') as file:
+            file.write(stream.getvalue())
+
+        self.logger.info(f'Profile of {name} ({duration:.2f}s) is written to {filename}')
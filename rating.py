@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from metrics import metrics
+
+
+class KinopoiskRating:
+    """
+    Получение рейтинга кинопоиска по id фильма.
+    Результаты кэшируются на время ttl, одновременные запросы одного id объединяются в один.
+    """
+
+    def __init__(self, url: str, ttl: int, timeout: int):
+        """
+        **Args**:
+
+         ``url``: шаблон url рейтинга, содержит {film_id}
+
+         ``ttl``: время жизни рейтинга в кэше, в секундах
+
+         ``timeout``: таймаут запроса рейтинга, в секундах
+        """
+
+        self.logger = logging.getLogger('main')
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._ratings = {}  # film_id -> (rating, время получения)
+        self._in_flight = {}  # film_id -> asyncio.Task
+
+    @staticmethod
+    def parse_rating(content) -> str:
+        """Возвращает рейтинг из xml-ответа кинопоиска"""
+
+        try:
+            return BeautifulSoup(content, 'html.parser').kp_rating.text
+        except AttributeError:
+            return '-'
+
+    def get_cached(self, film_id: str) -> Optional[str]:
+        """Возвращает рейтинг из кэша или None, если его нет или он устарел"""
+
+        with self._lock:
+            cached = self._ratings.get(film_id)
+            if cached is None:
+                return None
+
+            rating, ts = cached
+            if time.time() - ts >= self.ttl:
+                del self._ratings[film_id]
+                return None
+
+            return rating
+
+    def _store(self, film_id: str, rating: str):
+        with self._lock:
+            self._ratings[film_id] = (rating, time.time())
+
+    async def async_get_rating(self, session, film_id: str, proxy=None) -> str:
+        """
+        Асинхронное получение рейтинга
+
+        **Args**:
+
+         ``session``: aiohttp-сессия, через которую запрашиваются релизы
+
+         ``film_id``: id фильма на кинопоиске
+
+         ``proxy``: прокси для запроса
+        """
+
+        rating = self.get_cached(film_id)
+        if rating is not None:
+            return rating
+
+        with self._lock:
+            task = self._in_flight.get(film_id)
+            if task is None:
+                task = asyncio.get_event_loop().create_task(self._async_fetch(session, film_id, proxy))
+                task.add_done_callback(lambda t: self._forget(film_id, t))
+                self._in_flight[film_id] = task
+
+        return await asyncio.shield(task)
+
+    def _forget(self, film_id: str, task):
+        with self._lock:
+            if self._in_flight.get(film_id) is task:
+                del self._in_flight[film_id]
+
+    async def _async_fetch(self, session, film_id: str, proxy) -> str:
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            with metrics.timer('rating', 'kinopoisk'):
+                async with session.get(self.url.format(film_id=film_id), proxy=proxy, timeout=timeout) as response:
+                    content = await response.read()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(f'{error!r} [FILM ID]: {film_id}')
+            return '-'
+
+        rating = self.parse_rating(content)
+        self._store(film_id, rating)
+        return rating
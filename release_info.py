@@ -0,0 +1,64 @@
+from typing import NamedTuple, Optional, Union
+
+TORRENT_PENDING = 'pending'  # newstudio torrent-file url, that is not on the page yet
+
+
+class ReleaseInfo(NamedTuple):
+    """
+    Разобранные данные релиза: неизменяемая запись без __dict__ (кортеж).
+    Создается парсерами, читается функциями формирования ответа (render.py),
+    хранится в кэше релизов и передается между процессами (pickle) без повторного разбора страницы.
+    """
+
+    url: str
+    title: Optional[str] = None
+    kind: Optional[str] = None
+    photo: Optional[str] = None
+    genre: Optional[str] = None
+    country: Optional[str] = None
+    video: Optional[str] = None
+    audio: Optional[str] = None
+    description: Optional[str] = None
+    translate: Optional[str] = None
+    size: Optional[str] = None
+    torrent: Optional[str] = None
+    rating: Optional[str] = None
+    trailer_url: Optional[str] = None
+    link_more: Optional[str] = None
+    kinopoisk_id: Optional[str] = None  # id for rating lookup after parsing
+    trailer_search: Optional[tuple] = None  # (title, directors) for trailer lookup after parsing
+
+    def replace(self, **changes) -> 'ReleaseInfo':
+        """Возвращает копию записи с измененными полями"""
+
+        return self._replace(**changes)
+
+    def to_data(self) -> list:
+        """Возвращает компактное представление для json: список значений полей в порядке _fields"""
+
+        return list(self)
+
+    @classmethod
+    def from_data(cls, data: Union[list, dict], url: str = None) -> 'ReleaseInfo':
+        """
+        Создает запись из to_data() или из словаря полей (формат кэша прежних версий)
+
+        **Args**:
+
+         ``data``: список значений полей или словарь {поле: значение}
+
+         ``url``: url релиза, если его нет в data
+        """
+
+        if isinstance(data, dict):
+            fields = {field: data[field] for field in cls._fields if field in data}
+            fields.setdefault('url', url)
+            info = cls(**fields)
+        else:
+            info = cls(*data)
+
+        # json has no tuples
+        if isinstance(info.trailer_search, list):
+            title, directors = info.trailer_search
+            info = info.replace(trailer_search=(title, tuple(directors) if directors else None))
+        return info
@@ -0,0 +1,101 @@
+"""
+Формирование ответов бота по разобранным данным релиза (ReleaseInfo).
+"""
+
+from release_info import ReleaseInfo, TORRENT_PENDING
+
+exclude_genre = ['ТВ-Шоу', 'Мультфильм', 'Документальный', 'Anime', 'Спорт', 'КВН']
+access_country = ['США', 'Россия', 'Германия', 'Великобритания', 'Испания', 'Франция']
+
+
+def prepare_response(info: ReleaseInfo, is_single_request: bool = True, is_less_info: bool = True) -> str:
+    """
+    Подготавливает ответ в зависимости от сайта
+
+    **Args**:
+
+     ``info``: разобранные данные релиза
+
+     ``is_single_request``: является ли запрос одиночным (оповещение) или входит в список (/last)
+
+     ``is_less_info``: нужна ли только сокращенная информация о релизе
+    """
+
+    if 'newstudio' in info.url:
+        return prepare_response_newstudio(info, is_single_request)
+
+    return prepare_response_film(info, is_single_request, is_less_info)
+
+
+def prepare_response_film(info: ReleaseInfo, is_single_request: bool, is_less_info: bool) -> str:
+    """Подготавливает ответ с информацией о фильме"""
+
+    if is_less_info:
+        reply = prepare_response_film_less(info, is_single_request)
+    else:
+        reply = prepare_response_film_full(info)
+
+    return reply
+
+
+def prepare_response_film_less(info: ReleaseInfo, is_single_request: bool) -> str:
+    """Подготавливает сокращенное инфо для фильмов"""
+
+    if is_single_request and (any(exc_g in info.genre for exc_g in exclude_genre)
+                              or not any(acc_c in info.country for acc_c in access_country)):
+        return ''
+
+    kind = f"<b>{info.kind}</b><a href='{info.photo}'>.</a>\n" if is_single_request else ""
+    title = f"<a href='{info.url}'>{info.title}</a>" if is_single_request else f"{info.title}"
+
+    reply = (
+        f"{kind}"
+        f"{title}\n"
+        f"Рейтинг: {info.rating} ({info.link_more})\n\n"
+    )
+    return reply
+
+
+def prepare_response_film_full(info: ReleaseInfo) -> str:
+    """Подготавливает развернутое инфо для фильмов"""
+
+    audio = f"Аудио: {info.audio}\n" if info.audio else ''
+    size = f"Размер: {info.size}\n" if info.size else ''
+    trailer = f"<a href='{info.trailer_url}'>перейти</a>" if info.trailer_url else '-'
+
+    reply = (
+        f"<b>{info.kind}</b><a href='{info.photo}'>.</a>\n"
+        f"<a href='{info.url}'>{info.title}</a>\n"
+        f"Жанр: {info.genre}\n"
+        f"Страна: {info.country}\n"
+        f"Перевод: {info.translate}\n"
+        f"Видео: {info.video}\n"
+        f"{audio}"
+        f"{size}"
+        f"Рейтинг: {info.rating}\n"
+        f"Трейлер: {trailer}\n\n"
+        f"{info.description}\n"
+    )
+    return reply
+
+
+def prepare_response_newstudio(info: ReleaseInfo, is_single_request: bool) -> str:
+    """Подготавливает ответ для релиза с newstudio"""
+
+    reply = ''
+
+    if "WEBDLRip" in info.title:
+        return reply
+
+    if is_single_request:
+        reply = f"<b> \U0000203C РЕЛИЗ \U0000203C</b>\n"
+
+    if info.torrent == TORRENT_PENDING:
+        torrent = "Торрент ожидается \U000023F3"
+    else:
+        torrent = f"<a href='{info.torrent}'> Торрент \U0001F4E5</a>"
+
+    reply += (
+        f"{info.title} {torrent}\n\n"
+    )
+    return reply
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import aiohttp
+
+from metrics import metrics, get_site
+from parse_pool import ParsePool
+from runtime import AsyncRuntime
+
+
+class TorrentResolver:
+    """
+    Отложенное получение ссылки на торрент-файл релиза, которой еще нет на странице.
+    Страница запрашивается повторно в фоне с нарастающими паузами, не блокируя разбор остальных релизов.
+    """
+
+    def __init__(self, runtime: AsyncRuntime, parse_pool: ParsePool, parse: Callable, delays: List[int],
+                 timeout: int):
+        """
+        **Args**:
+
+         ``runtime``: фоновый цикл событий с общей aiohttp-сессией
+
+         ``parse_pool``: пул процессов, в котором разбираются страницы
+
+         ``parse``: функция parse(html) -> ссылка на торрент-файл или None, выполняется в parse_pool
+
+         ``delays``: паузы перед каждой попыткой, в секундах
+
+         ``timeout``: таймаут запроса страницы, в секундах
+        """
+
+        self.logger = logging.getLogger('main')
+        self.runtime = runtime
+        self.parse_pool = parse_pool
+        self.parse = parse
+        self.delays = delays
+        self.timeout = timeout
+        self.on_resolved = []  # callbacks on_resolved(url, torrent_url)
+
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def schedule(self, url: str, proxy=None):
+        """Ставит url в очередь на получение ссылки, повторно url не ставится, пока он в очереди"""
+
+        with self._lock:
+            if url in self._pending:
+                return
+            self._pending.add(url)
+
+        self.runtime.submit(self._resolve(url, proxy))
+
+    async def _fetch(self, session, url: str, proxy) -> Optional[str]:
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            with metrics.timer('torrent_fetch', get_site(url)):
+                async with session.get(url, proxy=proxy, timeout=timeout) as response:
+                    html = await response.read()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            self.logger.error(f'{error!r} [URL]: {url}')
+            return None
+
+        return await self.parse_pool.parse('torrent_parse', url, self.parse, html)
+
+    async def _resolve(self, url: str, proxy):
+        torrent_url = None
+        try:
+            session = await self.runtime.get_session()
+            for delay in self.delays:
+                await asyncio.sleep(delay)
+                torrent_url = await self._fetch(session, url, proxy)
+                if torrent_url:
+                    break
+
+                self.logger.error(f'Not found torrent-file url: {url}')
+
+        except Exception as error:
+            self.logger.exception(f'{error} [URL]: {url}')
+
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+        if not torrent_url:
+            self.logger.error(f'Torrent-file url is not resolved: {url}')
+            return
+
+        for callback in self.on_resolved:
+            try:
+                callback(url, torrent_url)
+            except Exception as error:
+                self.logger.exception(f'{error} [URL]: {url}')
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import aiohttp
+
+
+class AsyncRuntime:
+    """
+    Фоновый цикл событий с общей aiohttp-сессией для всех запросов к сайтам.
+    Сессия держит пул соединений с ограничением на хост и кэш DNS,
+    синхронный код передает в цикл корутины через submit/run.
+    """
+
+    def __init__(self, limit: int, limit_per_host: int, dns_cache_ttl: int, timeout: int):
+        """
+        **Args**:
+
+         ``limit``: максимальное число соединений
+
+         ``limit_per_host``: максимальное число соединений с одним хостом
+
+         ``dns_cache_ttl``: время жизни записи кэша DNS, в секундах
+
+         ``timeout``: таймаут запроса по умолчанию, в секундах
+        """
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._session = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Цикл событий фонового потока, запускается при первом обращении"""
+
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(name='Async-runtime', target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, вызывается только из цикла событий"""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_cache_ttl)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    def submit(self, coro) -> Future:
+        """Запускает корутину в фоновом цикле, не дожидаясь результата"""
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """Выполняет корутину в фоновом цикле и возвращает результат, не вызывается из самого цикла"""
+
+        return self.submit(coro).result(timeout)
+
+    def call(self, func, *args, timeout: float = None):
+        """Вызывает функцию в потоке цикла событий и возвращает результат"""
+
+        async def call():
+            return func(*args)
+
+        return self.run(call(), timeout)
+
+    async def _close_session(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def close(self, timeout: float = 10):
+        """Закрывает общую сессию, соединения пула освобождаются"""
+
+        if self._loop is not None:
+            self.run(self._close_session(), timeout)
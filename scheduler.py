@@ -0,0 +1,96 @@
+import random
+import time
+from typing import Iterable, List
+
+
+class PollScheduler:
+    """
+    Расписание опроса страниц со списками релизов, у каждой страницы - свой интервал.
+    После найденного релиза страница опрашивается чаще, после опроса без новых релизов - реже.
+    При ошибках интервал растет экспоненциально со случайным разбросом,
+    неработающая страница не задерживает опрос остальных.
+    """
+
+    def __init__(self, interval: float, interval_min: float, interval_max: float,
+                 speedup: float, slowdown: float, backoff_max: float, jitter: float):
+        """
+        **Args**:
+
+         ``interval``: начальный интервал опроса, в секундах
+
+         ``interval_min``, ``interval_max``: границы интервала опроса, в секундах
+
+         ``speedup``: множитель интервала после найденного релиза
+
+         ``slowdown``: множитель интервала после опроса без новых релизов
+
+         ``backoff_max``: максимальная пауза после ошибок подряд, в секундах
+
+         ``jitter``: доля случайного разброса паузы
+        """
+
+        self.interval = interval
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+
+        self._sources = {}  # url -> {'interval': .., 'next_poll': .., 'failures': ..}
+
+    def set_sources(self, urls: Iterable[str]):
+        """Задает опрашиваемые страницы, новые страницы опрашиваются сразу"""
+
+        urls = list(urls)
+        for url in urls:
+            self._sources.setdefault(url, {'interval': self.interval, 'next_poll': 0, 'failures': 0})
+
+        for url in set(self._sources) - set(urls):
+            del self._sources[url]
+
+    def get_due(self) -> List[str]:
+        """Возвращает страницы, которые пора опросить"""
+
+        now = time.monotonic()
+        return [url for url, source in self._sources.items() if source['next_poll'] <= now]
+
+    def get_wait_time(self) -> float:
+        """Возвращает время до ближайшего опроса, в секундах"""
+
+        if not self._sources:
+            return self.interval
+
+        next_poll = min(source['next_poll'] for source in self._sources.values())
+        return max(0.0, next_poll - time.monotonic())
+
+    def _spread(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def report(self, url: str, is_failed: bool, is_new_found: bool = False):
+        """
+        Планирует следующий опрос страницы по результату текущего
+
+        **Args**:
+
+         ``url``: url страницы
+
+         ``is_failed``: завершился ли опрос ошибкой
+
+         ``is_new_found``: найдены ли новые релизы
+        """
+
+        source = self._sources.get(url)
+        if source is None:
+            return
+
+        if is_failed:
+            source['failures'] += 1
+            delay = min(self.backoff_max, source['interval'] * 2 ** source['failures'])
+        else:
+            source['failures'] = 0
+            factor = self.speedup if is_new_found else self.slowdown
+            source['interval'] = min(self.interval_max, max(self.interval_min, source['interval'] * factor))
+            delay = source['interval']
+
+        source['next_poll'] = time.monotonic() + self._spread(delay)
@@ -4,14 +4,114 @@ ENCODING_NAME = 'utf-8'
 proxy = None
 timeout_upd_first = 3 * 60
 timeout_upd = 5 * 60
+timeout_listing = 5 * 60
 
-# number of urls for parsing on the site
+# per-host circuit breaker: after health_failures_threshold errors (or responses slower than health_slow_threshold)
+# in a row requests to the site fail fast, in health_open_timeout seconds the site is probed in background
+health_failures_threshold = 3
+health_slow_threshold = 60
+health_open_timeout = 60
+timeout_health_probe = 15
+health_latency_window = 100
+
+# adaptive polling of each listing page, timeout_upd is the initial interval
+poll_interval_min = 2 * 60
+poll_interval_max = 30 * 60
+poll_speedup = 0.5  # interval multiplier after new releases are found
+poll_slowdown = 1.25  # interval multiplier after a poll without new releases
+poll_backoff_max = 60 * 60  # max delay after consecutive failures
+poll_jitter = 0.1
+
+# crawl all listing pages concurrently (asyncio) instead of one by one
+async_crawl = True
+
+# shared aiohttp session of the background event loop
+http_connections_limit = 100
+num_connections_per_host = 4
+http_dns_cache_ttl = 10 * 60
+timeout_http = 2 * 60
+
+# number of urls taken from the first listing page, when no url of the page is known yet (first start)
 num_pars_url_megashara = 9
 num_pars_url_lordsfilm = 18
 num_pars_url_newstudio = 9
 
 # number of releases per site for response command /last
 num_last_release_per_site = 5
+# /last replies are prebuilt, a block of site is rebuilt at least this often, seconds
+last_digest_max_age = 60 * 60
+
+# telegram broadcast of new releases
+broadcast_workers = 16
+broadcast_rate_global = 25  # messages per second to all chats
+broadcast_rate_chat = 1  # messages per second to one chat
+broadcast_max_attempts = 3
+broadcast_history_size = 10000
+
+# newstudio torrent-file url, missing on a fresh release page, is requested again in background
+torrent_retry_delays = [60, 120, 240, 480, 960]  # seconds before each attempt
+timeout_torrent = 60
+
+# command handling: cheap commands (/start, /help) and slow ones (/last, /more, ...) use separate pools
+command_workers_fast = 4
+command_workers_slow = 4
+# slow commands of one chat running at the same time
+command_chat_limit = 1
+
+# prometheus metrics on http://metrics_host:metrics_port/metrics, None - disabled
+metrics_host = '127.0.0.1'
+metrics_port = None
+
+# logs: json records instead of text lines,
+# share of per-url debug lines (Starting, response.status, ...) that are written in debug mode
+log_json = False
+log_debug_sample_rate = 0.1
+
+# --profile: every profile_sample_every-th update cycle (and command of one kind) is profiled,
+# profile_top_n functions and allocation sites are written to logs/profile_*.txt
+profile_sample_every = 10
+profile_top_n = 30
+
+# processes that parse downloaded pages (listings and releases), 0 - parse in the event loop thread,
+# None - one less than the number of cores (0 on a single core, where the pool only adds pickling)
+parse_workers = None
+
+# html parser backend: 'html.parser', 'lxml' or 'selectolax' (html.parser is used if not installed).
+# lxml is in Pipfile, selectolax is optional: pip install selectolax
+html_parser = 'lxml'
+
+# kinopoisk rating lookups
+kinopoisk_rating_url = 'https://rating.kinopoisk.ru/{film_id}.xml'
+rating_cache_ttl = 12 * 60 * 60
+timeout_rating = 10
+
+# kinopoisk trailer lookups for /more: results (and "no trailer") are cached,
+# /more waits at most timeout_trailer seconds, a slower lookup fills the reply for the next /more
+trailer_cache_ttl = 24 * 60 * 60
+trailer_negative_cache_ttl = 60 * 60
+timeout_trailer = 3
+trailer_workers = 2
+
+# storage of seen urls and chats: 'sqlite' (data/data.sqlite3)
+# or 'journal' (append-only data/journal.jsonl, compacted into data/snapshot.json)
+storage_backend = 'sqlite'
+storage_journal_compact_every = 1000
+# seen urls kept per site (per newstudio forum)
+storage_retention = 1000
+
+# full info of alerted releases is fetched into the release cache in background, before the first /more
+prefetch_full_info = True
+prefetch_rate_per_host = 0.5  # requests per second to one site
+prefetch_queue_size = 100
+
+# cache of parsed releases (data/release_cache.json)
+release_cache_size = 2000
+release_cache_ttl = {  # seconds, by site name in release url
+    'megashara': 12 * 60 * 60,
+    'lordsfilm': 12 * 60 * 60,
+    'newstudio': 60 * 60,
+    'default': 60 * 60,
+}
 
 
 KEY_MEGA_FILM = 'mega_f'
@@ -29,3 +129,14 @@ sites = {  # sites for parsing
         *newstudio_subscr,
     ]
 }
+
+# listing pagination: url of page N (N >= 2) of a listing page by site key.
+# A poll reads pages until one of them contains a known url, at most listing_max_pages pages,
+# only the first page is requested conditionally (ETag / Last-Modified)
+listing_page_url = {
+    KEY_MEGA_FILM: lambda url, page: f'{url}/page/{page}/',
+    KEY_MEGA_SERIAL: lambda url, page: f'{url}/page/{page}/',
+    KEY_LORD_FILM: lambda url, page: f'{url}/page/{page}/',
+    KEY_NEWSTUDIO: lambda url, page: f'{url}&start={(page - 1) * 50}',  # 50 topics per forum page
+}
+listing_max_pages = 5
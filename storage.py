@@ -0,0 +1,445 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class SqliteStorage:
+    """
+    Хранилище просмотренных url релизов и чатов подписчиков в SQLite.
+    url хранятся по сайтам и группам (форумам newstudio) в порядке появления,
+    проверка наличия url выполняется по индексу, запись - построчно.
+    """
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS urls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site TEXT NOT NULL,
+            grp TEXT NOT NULL DEFAULT '',
+            url TEXT NOT NULL,
+            seen_at REAL NOT NULL,
+            UNIQUE (site, grp, url)
+        );
+        CREATE INDEX IF NOT EXISTS urls_site_grp_id ON urls (site, grp, id);
+
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id TEXT PRIMARY KEY,
+            username TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, filename: str):
+        self.logger = logging.getLogger('main')
+        self.filename = filename
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.schema)
+
+    def has_url(self, site: str, url: str, group: str = '') -> bool:
+        """Проверяет, встречался ли url ранее"""
+
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM urls WHERE site = ? AND grp = ? AND url = ?',
+                                     (site, group, url)).fetchone()
+        return row is not None
+
+    def add_new_urls(self, site: str, urls: List[str], group: str = '') -> List[str]:
+        """
+        Добавляет url, которые не встречались ранее, и возвращает их в порядке добавления
+
+        **Args**:
+
+         ``site``: ключ сайта из settings.sites
+
+         ``urls``: url в хронологическом порядке (от старых к новым)
+
+         ``group``: группа url внутри сайта (id форума newstudio)
+        """
+
+        new_urls = []
+        now = time.time()
+        with self._lock, self._conn:
+            for url in urls:
+                cursor = self._conn.execute('INSERT OR IGNORE INTO urls (site, grp, url, seen_at) VALUES (?, ?, ?, ?)',
+                                            (site, group, url, now))
+                if cursor.rowcount:
+                    new_urls.append(url)
+        return new_urls
+
+    def get_groups(self, site: str) -> List[str]:
+        """Возвращает группы url сайта в порядке их появления"""
+
+        with self._lock:
+            rows = self._conn.execute('SELECT grp FROM urls WHERE site = ? GROUP BY grp ORDER BY MIN(id)',
+                                      (site,)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_last_urls(self, site: str, limit: int, group: str = '') -> List[str]:
+        """Возвращает последние limit url сайта (группы) от старых к новым"""
+
+        with self._lock:
+            rows = self._conn.execute('SELECT url FROM urls WHERE site = ? AND grp = ? ORDER BY id DESC LIMIT ?',
+                                      (site, group, limit)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def get_all_urls(self, site: str) -> List[str]:
+        """Возвращает все url сайта в порядке появления"""
+
+        with self._lock:
+            rows = self._conn.execute('SELECT url FROM urls WHERE site = ? ORDER BY id', (site,)).fetchall()
+        return [row[0] for row in rows]
+
+    def prune(self, retention: int) -> Dict[str, List[str]]:
+        """Оставляет только последние retention url для каждого сайта и группы, возвращает удаленные url по сайтам"""
+
+        pruned = {}
+        with self._lock, self._conn:
+            groups = self._conn.execute('SELECT site, grp FROM urls GROUP BY site, grp HAVING COUNT(*) > ?',
+                                        (retention,)).fetchall()
+            for site, group in groups:
+                rows = self._conn.execute('SELECT id, url FROM urls WHERE site = ? AND grp = ? ORDER BY id DESC '
+                                          'LIMIT -1 OFFSET ?', (site, group, retention)).fetchall()
+                self._conn.executemany('DELETE FROM urls WHERE id = ?', [(row[0],) for row in rows])
+                pruned.setdefault(site, []).extend(row[1] for row in reversed(rows))
+        return pruned
+
+    def has_chat(self, chat_id) -> bool:
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM chats WHERE chat_id = ?', (str(chat_id),)).fetchone()
+        return row is not None
+
+    def add_chat(self, chat_id, username: Optional[str]):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO chats (chat_id, username) VALUES (?, ?)',
+                               (str(chat_id), username))
+
+    def get_chats(self) -> Dict[str, Optional[str]]:
+        """Возвращает чаты подписчиков: chat_id -> username"""
+
+        with self._lock:
+            rows = self._conn.execute('SELECT chat_id, username FROM chats ORDER BY rowid').fetchall()
+        return dict(rows)
+
+    def migrate_json(self, file_data_url: str, file_data_chats: str, encoding: str = 'utf-8'):
+        """
+        Однократно переносит данные из json файлов прежнего формата.
+        Файлы не удаляются, повторно они не загружаются.
+
+        **Args**:
+
+         ``file_data_url``: json файл url: {сайт: [url]} или {сайт: {группа: [url]}}
+
+         ``file_data_chats``: json файл чатов: {chat_id: username}
+        """
+
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+
+        if os.path.exists(file_data_url):
+            with open(file_data_url, 'r', encoding=encoding) as file:
+                data_urls = json.load(file)
+
+            for site, urls in data_urls.items():
+                if isinstance(urls, list):
+                    self.add_new_urls(site, urls)
+                else:
+                    for group, group_urls in urls.items():
+                        self.add_new_urls(site, group_urls, group)
+
+        if os.path.exists(file_data_chats):
+            with open(file_data_chats, 'r', encoding=encoding) as file:
+                data_chats = json.load(file)
+
+            for chat_id, username in data_chats.items():
+                self.add_chat(chat_id, username)
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(time.time()),))
+
+        self.logger.info(f'Data migrated from {file_data_url}, {file_data_chats} to {self.filename}')
+
+
+class JournalStorage:
+    """
+    Хранилище просмотренных url релизов и чатов подписчиков в памяти
+    с сохранением в журнал (одна добавленная запись - одна дописанная строка) и снимок.
+    Снимок записывается атомарно и периодически поглощает журнал.
+    При запуске состояние восстанавливается из снимка и хвоста журнала.
+    Интерфейс совпадает с SqliteStorage.
+    """
+
+    def __init__(self, filename_snapshot: str, filename_journal: str, compact_every: int,
+                 encoding: str = 'utf-8'):
+        """
+        **Args**:
+
+         ``filename_snapshot``: файл снимка состояния
+
+         ``filename_journal``: файл журнала
+
+         ``compact_every``: через сколько записей журнала записывать новый снимок
+        """
+
+        self.logger = logging.getLogger('main')
+        self.filename_snapshot = filename_snapshot
+        self.filename_journal = filename_journal
+        self.compact_every = compact_every
+        self.encoding = encoding
+
+        self._lock = threading.Lock()
+        self._urls = {}  # (site, grp) -> {url: seen_at} в порядке появления
+        self._chats = {}  # chat_id -> username
+        self._meta = {}
+        self._journal_size = 0
+
+        self._load()
+        self._journal = open(self.filename_journal, 'a', encoding=self.encoding)
+        if self._journal.tell() and not self._is_journal_complete():
+            self._journal.write('\n')  # end the record broken by crash
+
+    def _load(self):
+        """Восстанавливает состояние из снимка и журнала"""
+
+        if os.path.exists(self.filename_snapshot):
+            with open(self.filename_snapshot, 'r', encoding=self.encoding) as file:
+                snapshot = json.load(file)
+
+            for site, groups in snapshot['urls'].items():
+                for group, urls in groups.items():
+                    self._urls[(site, group)] = dict(urls)
+            self._chats = snapshot['chats']
+            self._meta = snapshot['meta']
+
+        if not os.path.exists(self.filename_journal):
+            return
+
+        with open(self.filename_journal, 'r', encoding=self.encoding) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # line was not written to the end before crash
+                    self.logger.error(f'Broken journal record skipped: {line!r}')
+                    continue
+
+                self._apply(record)
+                self._journal_size += 1
+
+    def _is_journal_complete(self) -> bool:
+        with open(self.filename_journal, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b'\n'
+
+    def _apply(self, record: dict):
+        if record['op'] == 'url':
+            self._urls.setdefault((record['site'], record['grp']), {}).setdefault(record['url'], record['ts'])
+        elif record['op'] == 'chat':
+            self._chats[record['chat_id']] = record['username']
+        elif record['op'] == 'meta':
+            self._meta[record['key']] = record['value']
+
+    def _write(self, records: List[dict]):
+        """Применяет записи и дописывает их в журнал, вызывается под self._lock"""
+
+        if not records:
+            return
+
+        for record in records:
+            self._apply(record)
+
+        self._journal.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+        self._journal_size += len(records)
+        if self._journal_size >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        """Записывает снимок состояния и очищает журнал, вызывается под self._lock"""
+
+        snapshot = {'urls': {}, 'chats': self._chats, 'meta': self._meta}
+        for (site, group), urls in self._urls.items():
+            snapshot['urls'].setdefault(site, {})[group] = list(urls.items())
+
+        tmp_filename = f'{self.filename_snapshot}.tmp'
+        with open(tmp_filename, 'w', encoding=self.encoding) as file:
+            file.write(json.dumps(snapshot, ensure_ascii=False))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, self.filename_snapshot)
+
+        self._journal.close()
+        self._journal = open(self.filename_journal, 'w', encoding=self.encoding)
+        self._journal_size = 0
+
+    def has_url(self, site: str, url: str, group: str = '') -> bool:
+        """Проверяет, встречался ли url ранее"""
+
+        with self._lock:
+            return url in self._urls.get((site, group), {})
+
+    def add_new_urls(self, site: str, urls: List[str], group: str = '') -> List[str]:
+        """
+        Добавляет url, которые не встречались ранее, и возвращает их в порядке добавления
+
+        **Args**:
+
+         ``site``: ключ сайта из settings.sites
+
+         ``urls``: url в хронологическом порядке (от старых к новым)
+
+         ``group``: группа url внутри сайта (id форума newstudio)
+        """
+
+        now = time.time()
+        with self._lock:
+            known_urls = self._urls.get((site, group), {})
+            new_urls = [url for url in dict.fromkeys(urls) if url not in known_urls]
+            self._write([{'op': 'url', 'site': site, 'grp': group, 'url': url, 'ts': now} for url in new_urls])
+        return new_urls
+
+    def get_groups(self, site: str) -> List[str]:
+        """Возвращает группы url сайта в порядке их появления"""
+
+        with self._lock:
+            return [group for (site_, group), urls in self._urls.items() if site_ == site and urls]
+
+    def get_last_urls(self, site: str, limit: int, group: str = '') -> List[str]:
+        """Возвращает последние limit url сайта (группы) от старых к новым"""
+
+        with self._lock:
+            urls = list(self._urls.get((site, group), {}))
+        return urls[-limit:] if limit else []
+
+    def get_all_urls(self, site: str) -> List[str]:
+        """Возвращает все url сайта (по группам) в порядке появления"""
+
+        with self._lock:
+            return [url for (site_, _), urls in self._urls.items() if site_ == site for url in urls]
+
+    def prune(self, retention: int) -> Dict[str, List[str]]:
+        """Оставляет только последние retention url для каждого сайта и группы, возвращает удаленные url по сайтам"""
+
+        pruned = {}
+        with self._lock:
+            for (site, group), urls in self._urls.items():
+                if len(urls) > retention:
+                    items = list(urls.items())
+                    self._urls[(site, group)] = dict(items[-retention:])
+                    pruned.setdefault(site, []).extend(url for url, _ in items[:-retention])
+
+            if pruned:
+                self._compact()
+        return pruned
+
+    def has_chat(self, chat_id) -> bool:
+        with self._lock:
+            return str(chat_id) in self._chats
+
+    def add_chat(self, chat_id, username: Optional[str]):
+        with self._lock:
+            self._write([{'op': 'chat', 'chat_id': str(chat_id), 'username': username}])
+
+    def get_chats(self) -> Dict[str, Optional[str]]:
+        """Возвращает чаты подписчиков: chat_id -> username"""
+
+        with self._lock:
+            return dict(self._chats)
+
+    def migrate_json(self, file_data_url: str, file_data_chats: str, encoding: str = 'utf-8'):
+        """
+        Однократно переносит данные из json файлов прежнего формата.
+        Файлы не удаляются, повторно они не загружаются.
+
+        **Args**:
+
+         ``file_data_url``: json файл url: {сайт: [url]} или {сайт: {группа: [url]}}
+
+         ``file_data_chats``: json файл чатов: {chat_id: username}
+        """
+
+        if 'json_migrated' in self._meta:
+            return
+
+        if os.path.exists(file_data_url):
+            with open(file_data_url, 'r', encoding=encoding) as file:
+                data_urls = json.load(file)
+
+            for site, urls in data_urls.items():
+                if isinstance(urls, list):
+                    self.add_new_urls(site, urls)
+                else:
+                    for group, group_urls in urls.items():
+                        self.add_new_urls(site, group_urls, group)
+
+        if os.path.exists(file_data_chats):
+            with open(file_data_chats, 'r', encoding=encoding) as file:
+                data_chats = json.load(file)
+
+            for chat_id, username in data_chats.items():
+                self.add_chat(chat_id, username)
+
+        with self._lock:
+            self._write([{'op': 'meta', 'key': 'json_migrated', 'value': str(time.time())}])
+            self._compact()
+
+        self.logger.info(f'Data migrated from {file_data_url}, {file_data_chats} to {self.filename_snapshot}')
+
+
+class ReleaseIndex:
+    """Индекс id релиза -> url по кодам сайтов (lf, mf, ms, ns) для команды /more"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._urls = {}  # код сайта -> {id релиза: url}
+
+    def add(self, site_code: str, release_id: str, url: str):
+        with self._lock:
+            self._urls.setdefault(site_code, {})[release_id] = url
+
+    def get(self, site_code: str, release_id: str) -> Optional[str]:
+        with self._lock:
+            return self._urls.get(site_code, {}).get(release_id)
+
+    def remove(self, site_code: str, release_id: str, url: str):
+        """Удаляет id релиза из индекса, если он указывает на url"""
+
+        with self._lock:
+            urls = self._urls.get(site_code, {})
+            if urls.get(release_id) == url:
+                del urls[release_id]
+
+
+def create_storage(backend: str, data_dir: str, journal_compact_every: int, encoding: str = 'utf-8'):
+    """
+    Создает хранилище просмотренных url и чатов
+
+    **Args**:
+
+     ``backend``: 'sqlite' - база SQLite, 'journal' - журнал со снимками
+
+     ``data_dir``: директория с данными
+    """
+
+    if backend == 'sqlite':
+        return SqliteStorage(os.path.join(data_dir, 'data.sqlite3'))
+
+    if backend == 'journal':
+        return JournalStorage(os.path.join(data_dir, 'snapshot.json'),
+                              os.path.join(data_dir, 'journal.jsonl'),
+                              compact_every=journal_compact_every,
+                              encoding=encoding)
+
+    raise ValueError(f'Unknown storage backend: {backend}')
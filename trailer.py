@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from kinopoisk.movie import Movie
+
+from metrics import metrics
+
+
+def search_kinopoisk(title: str, directors: Optional[List[str]]) -> Optional[str]:
+    """Получает ссылку на релиз на кинопоиске, если на кинопоиске есть трейлер (блокирующие запросы)"""
+
+    movie_list = Movie.objects.search(title)
+    if not movie_list:
+        return None
+
+    movie = movie_list[0]
+    # if directors:
+    #     movie.get_content('main_page')
+    #     if not any([d.name in directors for d in movie.directors]):
+    #         return None
+
+    movie.get_content('trailers')
+    return f"https://www.kinopoisk.ru/film/{movie.id}" if bool(movie.trailers) else None
+
+
+class TrailerService:
+    """
+    Поиск трейлера на кинопоиске вне потока обработки запроса.
+    Результаты кэшируются по (название, режиссеры), в том числе отрицательные - на меньшее время,
+    одновременные поиски одного релиза объединяются в один. Ожидание результата ограничено deadline,
+    поиск после этого продолжается, и его результат получит следующий запрос.
+    """
+
+    def __init__(self, ttl: int, negative_ttl: int, deadline: float, workers: int,
+                 search: Callable = search_kinopoisk):
+        """
+        **Args**:
+
+         ``ttl``: время жизни найденной ссылки в кэше, в секундах
+
+         ``negative_ttl``: время жизни отрицательного результата (трейлера нет), в секундах
+
+         ``deadline``: сколько запрос ждет результат поиска, в секундах
+
+         ``workers``: число потоков поиска
+
+         ``search``: функция search(title, directors) -> ссылка или None
+        """
+
+        self.logger = logging.getLogger('main')
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.deadline = deadline
+        self.search = search
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Trailer')
+        self._lock = threading.Lock()
+        self._trailers = {}  # key -> (ссылка или None, время получения)
+        self._in_flight = {}  # key -> Future
+
+    @staticmethod
+    def get_key(title: str, directors: Optional[List[str]]) -> tuple:
+        """Возвращает ключ кэша: название и режиссеры без учета регистра и лишних пробелов"""
+
+        def normalize(text):
+            return re.sub(r'\s+', ' ', text).strip().lower()
+
+        return normalize(title), tuple(sorted(normalize(director) for director in directors or []))
+
+    def _get_cached(self, key: tuple) -> tuple:
+        """Возвращает (найден ли результат в кэше, ссылка)"""
+
+        with self._lock:
+            cached = self._trailers.get(key)
+            if cached is None:
+                return False, None
+
+            trailer_url, ts = cached
+            if time.time() - ts >= (self.ttl if trailer_url else self.negative_ttl):
+                del self._trailers[key]
+                return False, None
+
+            return True, trailer_url
+
+    def lookup(self, title: str, directors: Optional[List[str]]) -> Future:
+        """Возвращает future с результатом поиска: из кэша, уже идущего поиска или нового"""
+
+        key = self.get_key(title, directors)
+        is_cached, trailer_url = self._get_cached(key)
+        if is_cached:
+            future = Future()
+            future.set_result(trailer_url)
+            return future
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._search, key, title, directors)
+                self._in_flight[key] = future
+
+        return future
+
+    def _search(self, key: tuple, title: str, directors: Optional[List[str]]) -> Optional[str]:
+        try:
+            with metrics.timer('trailer', 'kinopoisk'):
+                trailer_url = self.search(title, directors)
+
+        except Exception as error:
+            # not cached, the next request searches again
+            self.logger.error(f'{error!r} [TRAILER]: {title}')
+            trailer_url = None
+
+        else:
+            with self._lock:
+                self._trailers[key] = (trailer_url, time.time())
+
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+        return trailer_url
+
+    async def async_get(self, title: str, directors: Optional[List[str]]) -> Tuple[Optional[str], Optional[Future]]:
+        """
+        Асинхронно возвращает (ссылка на трейлер или None, future поиска, не уложившегося в deadline, или None).
+        Результат такого поиска можно получить через on_late, когда ответ уже сохранен
+
+        **Args**:
+
+         ``title``: название релиза для поиска
+
+         ``directors``: режиссеры релиза
+        """
+
+        future = self.lookup(title, directors)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.deadline), None
+
+        except asyncio.TimeoutError:
+            self.logger.info(f'Trailer search is over the deadline, continues in background: {title}')
+            return None, future
+
+    def on_late(self, future: Future, callback: Callable, title: str):
+        """
+        Вызывает callback(ссылка), когда поиск future завершится и найдет трейлер.
+        Если поиск уже завершился, callback вызывается сразу
+
+        **Args**:
+
+         ``future``: future поиска из async_get
+
+         ``callback``: функция callback(trailer_url)
+
+         ``title``: название релиза для лога
+        """
+
+        future.add_done_callback(lambda f: self._call_late(callback, f, title))
+
+    def _call_late(self, callback: Callable, future: Future, title: str):
+        trailer_url = future.result()
+        if not trailer_url:
+            return
+
+        try:
+            callback(trailer_url)
+        except Exception as error:
+            self.logger.exception(f'{error} [TRAILER]: {title}')